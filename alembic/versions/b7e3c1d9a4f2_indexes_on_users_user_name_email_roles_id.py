@@ -0,0 +1,50 @@
+"""Indexes on users user_name (unique), email, roles_id and active users
+
+Revision ID: b7e3c1d9a4f2
+Revises: 4cd48b91e40a
+Create Date: 2026-10-17 10:12:48.331502
+
+The indexes are built CONCURRENTLY so the migration can run while the API is
+serving requests, this can't happen inside a transaction so each statement is
+run in an autocommit block.
+
+If the unique index fails (duplicated user names), Postgres leaves an INVALID
+index behind: fix the duplicates, drop "ix_users_user_name" and upgrade again.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c1d9a4f2'
+down_revision: Union[str, None] = '4cd48b91e40a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_user_name', 'users', ['user_name'], unique=True, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_email', 'users', ['email'], unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_roles_id', 'users', ['roles_id'], unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_active', 'users', ['id'], unique=False,
+            postgresql_where=sa.text('terminated_at IS NULL'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_active', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_roles_id', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_email', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_user_name', table_name='users', postgresql_concurrently=True)
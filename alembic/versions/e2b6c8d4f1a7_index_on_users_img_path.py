@@ -0,0 +1,33 @@
+"""Index on users img_path for the uploads reference count
+
+Revision ID: e2b6c8d4f1a7
+Revises: d9a3e5f7b2c8
+Create Date: 2026-10-17 12:21:36.904158
+
+The index is built CONCURRENTLY so the migration can run while the API is
+serving requests, this can't happen inside a transaction so it is run in an
+autocommit block.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b6c8d4f1a7'
+down_revision: Union[str, None] = 'd9a3e5f7b2c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_img_path', 'users', ['img_path'], unique=False, postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_img_path', table_name='users', postgresql_concurrently=True)
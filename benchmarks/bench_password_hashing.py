@@ -0,0 +1,81 @@
+import os
+import time
+import logging
+import asyncio
+import argparse
+import statistics
+
+from anyio import to_thread
+
+from src.config import settings
+from src.auth.service import get_password_hash, verify_password, verify_password_async, shutdown_hash_pool
+
+##=============================================================================================
+## PASSWORD HASHING BENCHMARK
+##=============================================================================================
+
+# Silence passlib logging errors, because passlib is no longer mantained
+logging.getLogger('passlib').setLevel(logging.ERROR)
+
+# Compares a login storm verified on the request threadpool (before) against the
+# hashing process pool (after), run it from the project root with:
+#
+#   python -m benchmarks.bench_password_hashing --logins 60
+
+
+async def _unrelated_request_latency(stop: asyncio.Event) -> list[float]:
+    '''Latency of a no-op sync endpoint (threadpool job) while the logins run'''
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await to_thread.run_sync(lambda: None)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def _storm(verify, *, logins: int, hashed_password: str) -> tuple[float, list[float]]:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_unrelated_request_latency(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(verify("password123", hashed_password) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await probe
+
+
+async def _threadpool_verify(plain_password: str, hashed_password: str) -> bool:
+    # What a sync `def` route does: the whole bcrypt call holds a threadpool worker
+    return await to_thread.run_sync(verify_password, plain_password, hashed_password)
+
+
+def _report(name: str, *, logins: int, elapsed: float, cores: int, latencies: list[float]) -> None:
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else float("nan")
+    print(
+        f"{name:<12} {logins / elapsed:>10.1f} logins/s {logins / elapsed / cores:>10.1f} logins/s/core"
+        f" {p95:>10.2f} ms p95 unrelated request"
+    )
+
+
+async def main(*, logins: int) -> None:
+    hashed_password = get_password_hash("password123")
+    # Warming up the process pool so worker start up isn't measured
+    await asyncio.gather(*(verify_password_async("password123", hashed_password) for _ in range(settings.PASSWORD_HASH_WORKERS)))
+
+    elapsed, latencies = await _storm(_threadpool_verify, logins=logins, hashed_password=hashed_password)
+    _report("threadpool", logins=logins, elapsed=elapsed, cores=os.cpu_count() or 1, latencies=latencies)
+
+    elapsed, latencies = await _storm(verify_password_async, logins=logins, hashed_password=hashed_password)
+    _report("process pool", logins=logins, elapsed=elapsed, cores=settings.PASSWORD_HASH_WORKERS, latencies=latencies)
+
+    shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login (bcrypt verify) throughput benchmark")
+    parser.add_argument("--logins", type=int, default=60)
+    args = parser.parse_args()
+    # The storm must fit in the pool's queue, otherwise logins are rejected
+    if args.logins > settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH:
+        parser.error("--logins exceeds PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH")
+    asyncio.run(main(logins=args.logins))
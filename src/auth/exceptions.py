@@ -25,4 +25,11 @@ def Invalid_Token():
     return HTTPException(
         status_code=400,
         detail="Invalid token"
+    )
+
+def Hashing_Service_Busy():
+    return HTTPException(
+        status_code=503,
+        detail="The server is busy processing credentials, please try again later",
+        headers={"Retry-After": "1"}
     )
\ No newline at end of file
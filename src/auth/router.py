@@ -5,14 +5,14 @@ from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 
 from src.schemas import Message
-from src.dependencies import SessionDep
+from src.dependencies import AsyncSessionDep
 from src.auth import service, exceptions
 from src.config import settings
 from src.auth.schemas import Token, NewPassword
-from src.users.service import get_user_by_username, update_hash_password, authenticate
+from src.users.service import get_user_by_username_async, update_hash_password_async, authenticate_async
 from src.users.exceptions import User_Not_Found
 from src.mail.utils import generate_reset_password_email
-from src.mail.service import send_email
+from src.mail.queue import email_queue
 
 ##=============================================================================================
 ## AUTHORIZATION ROUTES
@@ -23,14 +23,14 @@ auth_routes = APIRouter()
 @auth_routes.post(
         "/access-token"
 )
-def login_access_token(
-    session: SessionDep, 
+async def login_access_token(
+    session: AsyncSessionDep, 
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
     '''
     OAuth2 compatible token login, get an access token for future requests
     '''
-    user = authenticate(
+    user = await authenticate_async(
         session=session, user_name=form_data.username, password=form_data.password
         )
     if not user:
@@ -49,11 +49,11 @@ def login_access_token(
 
 # Email sending endpoint
 @auth_routes.post("/password-recovery/{user_name}")
-def recover_password(session: SessionDep, user_name: str) -> Message:
+async def recover_password(session: AsyncSessionDep, user_name: str) -> Message:
     '''
     Password Recovery, through an email sent to the user's registered email
     '''
-    user = get_user_by_username(session=session, user_name=user_name)
+    user = await get_user_by_username_async(session=session, user_name=user_name)
 
     if not user:
         raise User_Not_Found()
@@ -66,23 +66,19 @@ def recover_password(session: SessionDep, user_name: str) -> Message:
     
     # Generating the email from template
     email_data = generate_reset_password_email(email_to=user.email, token=password_reset_token, username=user_name)
-    # Sending the email
-    send_email(
-        email_to=user.email,
-        subject=email_data.subject,
-        html_content=email_data.html_content
-    )
+    # Queuing the email, the delivery workers send it in the background
+    await email_queue.enqueue(session=session, email_to=user.email, email_data=email_data)
     return Message(message="Password recovery email sent")
 
 
 # Recovery endpoint
 @auth_routes.post("/reset-password")
-def reset_password(session: SessionDep, body: NewPassword) -> Message:
+async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message:
     '''
     Reset password
     '''
     user_name = service.verify_password_reset_token(token=body.token)
-    user = get_user_by_username(session=session, user_name=user_name)
+    user = await get_user_by_username_async(session=session, user_name=user_name)
 
     if not user:
         raise exceptions.Invalid_Token()
@@ -91,6 +87,6 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         raise exceptions.Terminated_User()
     
     # Using the service function at src.users.service to update the password
-    message = update_hash_password(session=session, db_user=user, password=body.new_password)
+    message = await update_hash_password_async(session=session, db_user=user, password=body.new_password)
 
     return Message(message=message)
\ No newline at end of file
@@ -1,11 +1,17 @@
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Callable
 
 import jwt
 from jwt import InvalidTokenError
 from passlib.context import CryptContext
 
 from src.config import settings
+from src.auth.exceptions import Hashing_Service_Busy
 
 # File that handles security
 
@@ -30,6 +36,66 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# Password hashing process pool
+# ---------------------------------------------------------------------------------------------
+
+_hash_pool: ProcessPoolExecutor | None = None
+_hash_pool_lock = threading.Lock()
+# Slots for running and queued hashing jobs, shared by every event loop in the process
+_hash_slots = threading.BoundedSemaphore(
+    settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH
+)
+
+
+def _init_hash_worker() -> None:
+    # Silence passlib logging errors in the workers, because passlib is no longer mantained
+    logging.getLogger('passlib').setLevel(logging.ERROR)
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    '''Returns the process pool used for bcrypt, creating it on first use'''
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # Spawned workers don't inherit the parent's threads or open connections
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_hash_worker,
+            )
+    return _hash_pool
+
+
+def shutdown_hash_pool() -> None:
+    '''Stops the hashing workers, a new pool is created on the next hashing call'''
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=True, cancel_futures=True)
+            _hash_pool = None
+
+
+async def _run_in_hash_pool(func: Callable[..., Any], *args: Any) -> Any:
+    # Reject right away when the workers and the queue are full (back-pressure)
+    if not _hash_slots.acquire(blocking=False):
+        raise Hashing_Service_Busy()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_pool(), func, *args)
+    finally:
+        _hash_slots.release()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    '''`verify_password` run in the hashing process pool'''
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    '''`get_password_hash` run in the hashing process pool'''
+    return await _run_in_hash_pool(get_password_hash, password)
+
+
 def generate_password_reset_token(username: str) -> str:
     delta = timedelta(hours=settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS)
     now = datetime.now(timezone.utc)
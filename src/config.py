@@ -71,6 +71,33 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_ASYNC_DATABASE_URI(self) -> PostgresDsn:
+        return MultiHostUrl.build(
+            scheme="postgresql+asyncpg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_SERVER,
+            port=self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    # Database connection pool, per engine (sync and async) and worker process
+    POOL_SIZE: int = 5
+    MAX_OVERFLOW: int = 10
+    POOL_TIMEOUT: float = 30 # seconds
+    POOL_RECYCLE: int = -1 # seconds, -1 never recycles connections
+    POOL_PRE_PING: bool = False
+
+    # Prometheus metrics endpoint at /metrics
+    METRICS_ENABLED: bool = True
+
+    # Total count strategy for list endpoints: "exact" count(*), "cached" exact count
+    # reused for COUNT_CACHE_TTL_SECONDS or "estimate" from the Postgres planner statistics
+    COUNT_STRATEGY: Literal["exact", "cached", "estimate"] = "exact"
+    COUNT_CACHE_TTL_SECONDS: int = 30
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -88,6 +115,27 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # Email templates, reloaded when changed on disk (only with ENVIRONMENT=local)
+    EMAIL_TEMPLATES_AUTO_RELOAD: bool = False
+    # Compiled templates bytecode, defaults to a directory in the system temp folder
+    EMAIL_TEMPLATES_BYTECODE_CACHE_DIR: str | None = None
+
+    # Email delivery queue (outbox table drained by background workers)
+    EMAIL_WORKERS: int = 1
+    EMAIL_BATCH_SIZE: int = 10
+    EMAIL_POLL_INTERVAL_SECONDS: float = 5
+    EMAIL_MAX_ATTEMPTS: int = 5
+    # Exponential backoff between attempts: base * 2 ** (attempt - 1), capped at max
+    EMAIL_RETRY_BACKOFF_SECONDS: float = 2
+    EMAIL_RETRY_BACKOFF_MAX_SECONDS: float = 300
+    # A claimed email is retried after this lease if its worker died while sending it
+    EMAIL_SEND_LEASE_SECONDS: float = 60
+
+    # Password hashing process pool
+    PASSWORD_HASH_WORKERS: int = 2
+    # Maximum hashing jobs waiting for a free worker before rejecting new ones
+    PASSWORD_HASH_QUEUE_DEPTH: int = 64
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
@@ -109,8 +157,24 @@ class Settings(BaseSettings):
     # First Role
     FIRST_ROLE: str 
 
-    # Uploads location path
+    # Uploads location path (local storage root)
     UPLOADS_URL: str = 'development_files'
+    # Uploads storage backend, "s3" works with any S3 compatible object storage
+    STORAGE_BACKEND: Literal["local", "s3"] = "local"
+    S3_BUCKET: str | None = None
+    S3_ENDPOINT_URL: str | None = None
+    S3_REGION: str | None = None
+    S3_ACCESS_KEY_ID: str | None = None
+    S3_SECRET_ACCESS_KEY: str | None = None
+    S3_MAX_POOL_CONNECTIONS: int = 10
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024 # bytes
+    S3_MULTIPART_CHUNKSIZE: int = 8 * 1024 * 1024 # bytes
+    # Lifetime of the presigned URLs clients are redirected to
+    STORAGE_PRESIGN_EXPIRES_SECONDS: int = 300
+    # Resized image variants, created in a process pool
+    IMAGE_PROCESS_WORKERS: int = 1
+    IMAGE_VARIANT_FORMAT: Literal["WEBP", "JPEG"] = "WEBP"
+    IMAGE_VARIANT_QUALITY: int = 80
 
     # Testing environment
     TEST: bool = False
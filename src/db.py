@@ -1,17 +1,43 @@
 from sqlmodel import Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from src.config import settings
+from src.metrics import TimedQueuePool, TimedAsyncAdaptedQueuePool, pool_collector
 from src.users.models import Users, Roles
 from src.users.schemas import CreateUser, CreateRole
 from src.users import service
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+def pool_options(*, name: str) -> dict:
+    '''Connection pool settings shared by the engines, `name` labels the pool metrics'''
+    return {
+        "pool_size": settings.POOL_SIZE,
+        "max_overflow": settings.MAX_OVERFLOW,
+        "pool_timeout": settings.POOL_TIMEOUT,
+        "pool_recycle": settings.POOL_RECYCLE,
+        "pool_pre_ping": settings.POOL_PRE_PING,
+        "pool_logging_name": name,
+    }
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), poolclass=TimedQueuePool, **pool_options(name="sync")
+)
+
+# Async engine (asyncpg) used by the routes, objects stay loaded after commit because
+# lazy loading is not available with AsyncSession
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_ASYNC_DATABASE_URI), poolclass=TimedAsyncAdaptedQueuePool, **pool_options(name="async")
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+pool_collector.register_engine(name="sync", engine=engine)
+pool_collector.register_engine(name="async", engine=async_engine.sync_engine)
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
 # otherwise, SQLModel might fail to initialize relationships properly
 # for more details: https://github.com/fastapi/full-stack-fastapi-template/issues/28
 
-def init_db(session: Session) -> None:
+async def init_db(session: Session) -> None:
     # Initialize the database session
     role = session.exec(
         select(Roles).where(Roles.name == settings.FIRST_ROLE)
@@ -40,4 +66,4 @@ def init_db(session: Session) -> None:
             salary=0.0,
             birthday=settings.FIRST_SUPERUSER_BIRTHDAY
         )
-        user = service.create_user(session=session, user_create=user_in, role=role)
\ No newline at end of file
+        user = await service.create_user(session=session, user_create=user_in, role=role)
\ No newline at end of file
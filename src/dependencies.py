@@ -1,4 +1,4 @@
-from collections.abc import Generator
+from collections.abc import Generator, AsyncGenerator
 from typing import Annotated
 
 import jwt
@@ -6,15 +6,17 @@ from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy.orm import joinedload
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.auth import service
 from src.config import settings
-from src.db import engine
+from src.db import engine, AsyncSessionLocal
 from src.auth.schemas import TokenPayload
 from src.auth.exceptions import Terminated_User, Invalid_Credentials
 from src.users.models import Users
-from src.users.service import get_user_by_id
+from src.users.service import get_user_by_id_async
 from src.users.exceptions import Insufficient_Privileges, User_Not_Found
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -27,11 +29,17 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> Users:
+async def get_current_user(session: AsyncSessionDep, token: TokenDep) -> Users:
     '''Method to get the current user'''
     try:
         payload = jwt.decode(
@@ -40,7 +48,8 @@ def get_current_user(session: SessionDep, token: TokenDep) -> Users:
         token_data = TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise Invalid_Credentials()
-    user = get_user_by_id(session=session, user_id=token_data.sub)
+    # The role is joined for routes returning the current user with its role
+    user = await get_user_by_id_async(session=session, user_id=token_data.sub, options=[joinedload(Users.role)])
     if not user:
         raise User_Not_Found()
     if user.terminated_at is not None:
@@ -51,16 +60,15 @@ def get_current_user(session: SessionDep, token: TokenDep) -> Users:
 CurrentUser = Annotated[Users, Depends(get_current_user)]
 
 
-def get_current_active_owner(current_user: CurrentUser) -> Users:
+async def get_current_active_owner(current_user: CurrentUser) -> Users:
     '''Method for validating if a user is an owner'''
     if not current_user.is_owner:
         raise Insufficient_Privileges()
     return current_user
 
 
-def get_current_active_admin(current_user: CurrentUser) -> Users:
+async def get_current_active_admin(current_user: CurrentUser) -> Users:
     '''Method for validating if a user is an admin'''
     if not current_user.is_admin:
         raise Insufficient_Privileges()
     return current_user
-
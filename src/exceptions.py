@@ -38,4 +38,13 @@ def File_Not_Found():
     return HTTPException(
         status_code=400,
         detail="File not found."
+    )
+
+# PAGINATION EXCEPTIONS
+# ---------------------------------------------------------------------------------------------
+
+def Invalid_Cursor():
+    return HTTPException(
+        status_code=400,
+        detail="Invalid pagination cursor."
     )
\ No newline at end of file
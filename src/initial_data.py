@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from sqlmodel import Session
@@ -11,16 +12,16 @@ logger = logging.getLogger(__name__)
 # Silence passlib logging errors, because passlib is no longer mantained 
 logging.getLogger('passlib').setLevel(logging.ERROR)
 
-def init() -> None:
+async def init() -> None:
     with Session(engine) as session:
-        init_db(session)
+        await init_db(session)
 
 
-def main() -> None:
+async def main() -> None:
     logger.info("Creating initial data")
-    init()
+    await init()
     logger.info("Initial data created")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+from typing import Literal
+
+from sqlalchemy import Index, Text
+from sqlmodel import Field, SQLModel
+
+##=============================================================================================
+## SQLMODELS
+##=============================================================================================
+
+# Email outbox
+# ---------------------------------------------------------------------------------------------
+
+OutboxStatus = Literal["pending", "sent", "failed"]
+
+
+def utcnow() -> datetime:
+    '''Naive UTC timestamp, the outbox columns are stored without a time zone'''
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class EmailOutbox(SQLModel, table=True):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # The delivery workers poll the pending emails due for an attempt
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str = Field(default="", max_length=255)
+    # Emptied after the delivery, it may contain credentials (new account emails)
+    html_content: str = Field(default="", sa_type=Text)
+    status: str = Field(default="pending", max_length=10)
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=utcnow)
+    last_error: str | None = Field(default=None, max_length=255)
+    created_at: datetime = Field(default_factory=utcnow)
+    sent_at: datetime | None = Field(default=None)
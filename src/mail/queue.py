@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config import settings
+from src.db import AsyncSessionLocal
+from src.mail import service
+from src.mail.models import EmailOutbox
+from src.mail.schemas import EmailData
+
+logger = logging.getLogger(__name__)
+
+##=============================================================================================
+## EMAIL DELIVERY QUEUE
+##=============================================================================================
+
+class EmailDeliveryQueue:
+    '''
+    Background workers draining the email outbox table.
+
+    The routes only insert the email in the outbox and wake the workers up, the emails
+    survive restarts and other processes' workers find them when polling.
+    '''
+
+    def __init__(self) -> None:
+        self._wakeup: asyncio.Event | None = None
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self, *, workers: int = settings.EMAIL_WORKERS, session_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._run(session_factory=session_factory), name=f"email-worker-{n}")
+            for n in range(workers)
+        ]
+
+    async def stop(self) -> None:
+        '''Cancels the workers, an email interrupted while sending is retried after its lease'''
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue(self, *, session: AsyncSession, email_to: str, email_data: EmailData) -> EmailOutbox:
+        email = await service.enqueue_email_async(
+            session=session, email_to=email_to, subject=email_data.subject, html_content=email_data.html_content
+        )
+        self.notify()
+        return email
+
+    async def _run(self, *, session_factory: async_sessionmaker[AsyncSession]) -> None:
+        while True:
+            # Cleared before polling so an email enqueued meanwhile wakes the worker again
+            self._wakeup.clear()
+            try:
+                async with session_factory() as session:
+                    claimed = await service.deliver_due_emails_async(session=session, limit=settings.EMAIL_BATCH_SIZE)
+            except Exception:
+                logger.exception("email delivery worker failed, retrying after the poll interval")
+                claimed = 0
+
+            if claimed < settings.EMAIL_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.EMAIL_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+
+email_queue = EmailDeliveryQueue()
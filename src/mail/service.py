@@ -1,11 +1,18 @@
+import random
 import logging
+from datetime import timedelta
 from typing import Any
 from pathlib import Path
 
 import emails
-from jinja2 import Template
+from emails.backend.response import SMTPResponse
+from fastapi.concurrency import run_in_threadpool
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.config import settings
+from src.mail.models import EmailOutbox, utcnow
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,15 +21,51 @@ logger = logging.getLogger(__name__)
 ## MAIL FUNCTIONS
 ##=============================================================================================
 
+TEMPLATES_DIR = Path(__file__).parent / "templates" / "build"
+
+
+def create_template_environment() -> Environment:
+    '''
+    Jinja environment over the built templates, compiled templates are kept in memory and
+    their bytecode on disk (shared between worker processes and restarts).
+
+    The templates are checked for changes on every render only when EMAIL_TEMPLATES_AUTO_RELOAD
+    is set in a local environment.
+    '''
+    bytecode_dir = settings.EMAIL_TEMPLATES_BYTECODE_CACHE_DIR
+    if bytecode_dir:
+        Path(bytecode_dir).mkdir(parents=True, exist_ok=True)
+
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        bytecode_cache=FileSystemBytecodeCache(directory=bytecode_dir),
+        auto_reload=settings.EMAIL_TEMPLATES_AUTO_RELOAD and settings.ENVIRONMENT == "local",
+    )
+
+
+template_env = create_template_environment()
+
+
+def precompile_email_templates() -> list[str]:
+    '''
+    Compiles every template ahead of the first email (called at startup).
+
+    Returns
+    ---
+    The names of the compiled templates.
+    '''
+    template_names = template_env.list_templates(extensions=["html"])
+    for template_name in template_names:
+        template_env.get_template(template_name)
+    return template_names
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = template_env.get_template(template_name).render(context)
     return html_content
 
 
-def send_email(*, email_to: str, subject: str = "", html_content: str = "") -> None:
+def send_email(*, email_to: str, subject: str = "", html_content: str = "") -> SMTPResponse:
     assert settings.emails_enabled, "No provided configuration for email variables"
     # Building the message using emails
     message = emails.Message(
@@ -44,4 +87,97 @@ def send_email(*, email_to: str, subject: str = "", html_content: str = "") -> N
 
     response = message.send(to=email_to, smtp=smtp_options)
     logger.info(f"send email result: {response}")
+    return response
+
+
+##=============================================================================================
+## EMAIL OUTBOX
+##=============================================================================================
+
+def retry_delay(*, attempts: int) -> float:
+    '''
+    Seconds to wait before the next delivery attempt, exponential on the failed attempts with
+    a ±10% jitter so emails that failed together don't retry together.
+    '''
+    delay = settings.EMAIL_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return min(delay, settings.EMAIL_RETRY_BACKOFF_MAX_SECONDS) * random.uniform(0.9, 1.1)
+
+
+async def enqueue_email_async(*, session: AsyncSession, email_to: str, subject: str = "", html_content: str = "") -> EmailOutbox:
+    db_obj = EmailOutbox(email_to=email_to, subject=subject, html_content=html_content)
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    return db_obj
+
+
+async def claim_due_emails_async(*, session: AsyncSession, limit: int) -> list[EmailOutbox]:
+    '''
+    Claims the pending emails due for an attempt, leasing them for EMAIL_SEND_LEASE_SECONDS.
+
+    Returns
+    ---
+    The claimed emails, with the attempt already counted. Rows locked by another worker
+    are skipped (Postgres), an email whose worker died is claimed again after its lease.
+    '''
+    now = utcnow()
+    statement = (
+        select(EmailOutbox)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    emails = list((await session.exec(statement)).all())
+    for email in emails:
+        email.attempts += 1
+        email.next_attempt_at = now + timedelta(seconds=settings.EMAIL_SEND_LEASE_SECONDS)
+        session.add(email)
+    await session.commit()
+    return emails
+
+
+async def record_delivery_async(*, session: AsyncSession, email: EmailOutbox, error: str | None = None) -> EmailOutbox:
+    '''Marks a claimed email as sent, or schedules its retry (failed after EMAIL_MAX_ATTEMPTS)'''
+    if error is None:
+        email.status = "sent"
+        email.sent_at = utcnow()
+        email.html_content = ""
+        email.last_error = None
+    else:
+        email.last_error = error[:255]
+        if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            email.status = "failed"
+        else:
+            email.next_attempt_at = utcnow() + timedelta(seconds=retry_delay(attempts=email.attempts))
+    session.add(email)
+    await session.commit()
+    return email
+
+
+async def deliver_email_async(*, session: AsyncSession, email: EmailOutbox) -> bool:
+    '''Sends a claimed email (blocking SMTP call, kept off the event loop) and records the result'''
+    try:
+        response = await run_in_threadpool(
+            send_email, email_to=email.email_to, subject=email.subject, html_content=email.html_content
+        )
+        error = None if response.success else f"SMTP {response.status_code}: {response.error or response.status_text}"
+    except Exception as e:
+        error = repr(e)
+
+    if error is not None:
+        logger.warning(f"email {email.id} to {email.email_to} failed (attempt {email.attempts}): {error}")
+    await record_delivery_async(session=session, email=email, error=error)
+    return error is None
+
 
+async def deliver_due_emails_async(*, session: AsyncSession, limit: int) -> int:
+    '''
+    Returns
+    ---
+    The number of emails claimed, the caller polls again right away when the batch was full.
+    '''
+    emails = await claim_due_emails_async(session=session, limit=limit)
+    for email in emails:
+        await deliver_email_async(session=session, email=email)
+    return len(emails)
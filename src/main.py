@@ -1,12 +1,17 @@
 # import sentry_sdk <- Uncomment after reading about the package
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
+from prometheus_client import make_asgi_app
 from starlette.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from src.router import api_router
 from src.config import settings
 from src.initial_data import main as initial_data
+from src.auth.service import shutdown_hash_pool
+from src.uploads import shutdown_image_pool
+from src.mail.queue import email_queue
+from src.mail.service import precompile_email_templates
 
 def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.tags[0]}-{route.name}"
@@ -18,9 +23,18 @@ if settings.SENTRY_DSN and settings.ENVIRONMENT != 'local':
 # Creating initial data at startup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Compiling the email templates before the first request needs them
+    precompile_email_templates()
     if not settings.TEST:
-        initial_data()
+        await initial_data()
+        # Email delivery workers draining the outbox
+        if settings.emails_enabled:
+            email_queue.start()
     yield
+    await email_queue.stop()
+    # Stopping the password hashing and image workers
+    shutdown_hash_pool()
+    shutdown_image_pool()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -39,4 +53,8 @@ if settings.all_cors_origins:
         allow_headers=["*"]
     )
 
-app.include_router(api_router, prefix=settings.API_V1_STR)
\ No newline at end of file
+app.include_router(api_router, prefix=settings.API_V1_STR)
+
+# Prometheus metrics (database pools, etc.)
+if settings.METRICS_ENABLED:
+    app.mount("/metrics", make_asgi_app())
\ No newline at end of file
@@ -0,0 +1,83 @@
+import time
+from typing import Any
+
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import Engine, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+##=============================================================================================
+## PROMETHEUS METRICS
+##=============================================================================================
+
+# Database connection pools
+# ---------------------------------------------------------------------------------------------
+
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent obtaining a connection from the pool (waiting, connecting and pre-ping)",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts",
+    "Connection requests that gave up after POOL_TIMEOUT seconds",
+    ["engine"],
+)
+
+
+class TimedPoolMixin:
+    '''Records the checkout wait time and timeouts, the engine label is the pool logging name'''
+
+    def connect(self) -> Any:
+        engine_name = self._orig_logging_name or "default"
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(engine=engine_name).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(engine=engine_name).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class PoolCollector(Collector):
+    '''Reports the state of the registered engines' pools on every scrape'''
+
+    def __init__(self) -> None:
+        self._engines: dict[str, Engine] = {}
+
+    def register_engine(self, *, name: str, engine: Engine) -> None:
+        self._engines[name] = engine
+
+    def collect(self):
+        size = GaugeMetricFamily("db_pool_size", "Connections kept open by the pool (POOL_SIZE)", labels=["engine"])
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections in use", labels=["engine"])
+        checked_in = GaugeMetricFamily("db_pool_checked_in", "Idle connections in the pool", labels=["engine"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections open above POOL_SIZE (negative while the pool fills up)", labels=["engine"])
+
+        for name, engine in self._engines.items():
+            pool = engine.pool
+            # Pools without a queue (e.g. NullPool, StaticPool) have nothing to report
+            if not isinstance(pool, QueuePool):
+                continue
+            size.add_metric([name], pool.size())
+            checked_out.add_metric([name], pool.checkedout())
+            checked_in.add_metric([name], pool.checkedin())
+            overflow.add_metric([name], pool.overflow())
+
+        yield from (size, checked_out, checked_in, overflow)
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
@@ -3,4 +3,5 @@
 ## GLOBAL SQLMODELS
 ##=============================================================================================
 
-from src.users.models import *
\ No newline at end of file
+from src.users.models import *
+from src.mail.models import *
\ No newline at end of file
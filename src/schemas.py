@@ -11,6 +11,8 @@ class ImageCons():
     ALLOWED_CONTENT_TYPES: list[str]
     MAX_IMAGE_SIZE: int
     UPLOAD_SUB_DIR: str
+    # Resized variants (px, longest side) created after the upload
+    VARIANT_SIZES: tuple[int, ...] = ()
 
 # Generic message schema
 class Message(SQLModel):
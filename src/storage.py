@@ -0,0 +1,250 @@
+import os
+import shutil
+import tempfile
+import threading
+import contextlib
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from urllib.parse import quote
+
+from src.config import settings
+from src.exceptions import Invalid_Configuration
+
+##=============================================================================================
+## STORAGE BACKENDS
+##=============================================================================================
+
+# Files are addressed by keys, relative posix paths such as "user_imgs/ab/cd/<digest>.png".
+# The methods block (disk or network I/O), async callers run them in a worker thread.
+
+class StorageBackend(ABC):
+    # Directory for the temporary files handed to `put`
+    staging_dir: str
+
+    @abstractmethod
+    def put(self, *, key: str, source_path: str, content_type: str | None = None) -> None:
+        '''Stores the file at `source_path` under `key`, the source file is consumed'''
+
+    @abstractmethod
+    def get(self, *, key: str) -> bytes:
+        '''Returns the stored bytes, raises FileNotFoundError for unknown keys'''
+
+    @abstractmethod
+    def stream(self, *, key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        '''Yields the stored bytes in chunks, raises FileNotFoundError for unknown keys'''
+
+    @abstractmethod
+    def delete(self, *, key: str) -> None:
+        '''Removes the stored file, unknown keys are ignored'''
+
+    @abstractmethod
+    def exists(self, *, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def presign(self, *, key: str, expires_in: int) -> str:
+        '''URL giving temporary read access to the file'''
+
+    @abstractmethod
+    def open_local(self, *, key: str) -> contextlib.AbstractContextManager[str]:
+        '''Context manager yielding a local path with the file contents (read only)'''
+
+
+# Local filesystem
+# ---------------------------------------------------------------------------------------------
+
+class LocalStorage(StorageBackend):
+    '''Files under `root`, for local development and single server deployments'''
+
+    def __init__(self, *, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self.staging_dir = os.path.join(self.root, ".staging")
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        '''Filesystem path of a key, raises FileNotFoundError for keys outside the root'''
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise FileNotFoundError(key)
+        return path
+
+    def put(self, *, key: str, source_path: str, content_type: str | None = None) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Atomic within the same filesystem, readers never see a partially written file
+        os.replace(source_path, path)
+
+    def get(self, *, key: str) -> bytes:
+        with open(self.path(key), "rb") as file:
+            return file.read()
+
+    def stream(self, *, key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+    def delete(self, *, key: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(key))
+
+    def exists(self, *, key: str) -> bool:
+        try:
+            return os.path.isfile(self.path(key))
+        except FileNotFoundError:
+            return False
+
+    def presign(self, *, key: str, expires_in: int) -> str:
+        # Served by the API itself, the expiration is not enforced
+        return f"{settings.API_V1_STR}/files/images?path={quote(key)}"
+
+    @contextlib.contextmanager
+    def open_local(self, *, key: str) -> Iterator[str]:
+        path = self.path(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(key)
+        yield path
+
+
+# S3 compatible object storage
+# ---------------------------------------------------------------------------------------------
+
+class S3Storage(StorageBackend):
+    '''
+    Files in an S3 compatible bucket (AWS S3, MinIO, GCS interoperability, ...).
+
+    The client is created once and shared by every request, its connection pool holds up to
+    S3_MAX_POOL_CONNECTIONS connections. Files larger than S3_MULTIPART_THRESHOLD are uploaded
+    in parts.
+    '''
+
+    def __init__(
+            self,
+            *,
+            bucket: str,
+            endpoint_url: str | None = None,
+            region: str | None = None,
+            access_key_id: str | None = None,
+            secret_access_key: str | None = None,
+            max_pool_connections: int = 10,
+            multipart_threshold: int = 8 * 1024 * 1024,
+            multipart_chunksize: int = 8 * 1024 * 1024
+        ) -> None:
+        # pip install boto3 # To use S3 compatible storage
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.staging_dir = tempfile.gettempdir()
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(max_pool_connections=max_pool_connections, retries={"mode": "standard"}),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize
+        )
+
+    def _not_found(self, e: Exception) -> bool:
+        return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, *, key: str, source_path: str, content_type: str | None = None) -> None:
+        extra_args = {"ContentType": content_type} if content_type else None
+        try:
+            self.client.upload_file(source_path, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(source_path)
+
+    def _get_body(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        except self._client_error as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def get(self, *, key: str) -> bytes:
+        body = self._get_body(key)
+        with contextlib.closing(body):
+            return body.read()
+
+    def stream(self, *, key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        body = self._get_body(key)
+        with contextlib.closing(body):
+            yield from body.iter_chunks(chunk_size)
+
+    def delete(self, *, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, *, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if self._not_found(e):
+                return False
+            raise
+        return True
+
+    def presign(self, *, key: str, expires_in: int) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in
+        )
+
+    @contextlib.contextmanager
+    def open_local(self, *, key: str) -> Iterator[str]:
+        tmp_dir = tempfile.mkdtemp(dir=self.staging_dir)
+        try:
+            path = os.path.join(tmp_dir, os.path.basename(key))
+            with open(path, "wb") as file:
+                for chunk in self.stream(key=key):
+                    file.write(chunk)
+            yield path
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Configured backend
+# ---------------------------------------------------------------------------------------------
+
+_storage: StorageBackend | None = None
+_storage_lock = threading.Lock()
+
+
+def create_storage() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(root=settings.UPLOADS_URL)
+
+    if not settings.S3_BUCKET:
+        raise Invalid_Configuration()
+    return S3Storage(
+        bucket=settings.S3_BUCKET,
+        endpoint_url=settings.S3_ENDPOINT_URL,
+        region=settings.S3_REGION,
+        access_key_id=settings.S3_ACCESS_KEY_ID,
+        secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+    )
+
+
+def get_storage() -> StorageBackend:
+    '''Returns the storage backend shared by the process, creating it on first use'''
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+    return _storage
+
+
+def set_storage(storage: StorageBackend | None) -> None:
+    '''Replaces the shared backend (None creates it again from the settings on next use)'''
+    global _storage
+    with _storage_lock:
+        _storage = storage
@@ -1,61 +1,243 @@
-# pip install google-cloud-storage # To use the uploading service
-# from google.cloud import storage
 import os
-from fastapi import UploadFile
+import re
+import hashlib
+import functools
+import posixpath
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-from src.exceptions import File_Too_Large, Unsupported_File, Upload_Failed, Invalid_Configuration
+import anyio
+from fastapi import UploadFile, HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.exceptions import File_Too_Large, Unsupported_File, Upload_Failed
 from src.config import settings
 from src.schemas import ImageCons
+from src.storage import StorageBackend, get_storage
+
+# Bytes read from the upload and written to disk at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# CONTENT ADDRESSED STORAGE
+# ---------------------------------------------------------------------------------------------
+
+# Stored files are named after the sha256 of their bytes (variants add a "_<size>" suffix)
+CONTENT_FILENAME = re.compile(r"^[0-9a-f]{64}(_\d+)?\.\w+$")
+
+
+def content_key(*, prefix: str, digest: str, extension: str) -> str:
+    '''Sharded storage key of a file, `<prefix>/<ab>/<cd>/<digest>.<extension>`'''
+    return posixpath.join(prefix, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+
+def is_content_addressed(path: str) -> bool:
+    '''Stored files never change, their URLs can be cached forever'''
+    return bool(CONTENT_FILENAME.match(posixpath.basename(path)))
+
+
+def _put_if_missing(*, storage: StorageBackend, key: str, source_path: str, content_type: str | None) -> None:
+    if storage.exists(key=key):
+        # Identical bytes already stored
+        os.remove(source_path)
+    else:
+        storage.put(key=key, source_path=source_path, content_type=content_type)
+
+
+async def store_upload(*, upload: UploadFile, prefix: str, extension: str, max_bytes: int) -> str:
+    '''
+    Streams the upload in chunks to a temporary file (file writes run in a worker thread),
+    hashing it on the way, and stores it under its content address. Readers never see a
+    partially written file and identical uploads are stored once.
+
+    Returns
+    ---
+    The storage key of the file, raises File_Too_Large as soon as the stream passes `max_bytes`.
+    '''
+    storage = get_storage()
+    fd, tmp_path = tempfile.mkstemp(dir=storage.staging_dir, prefix=".upload-", suffix=".part")
+    os.close(fd)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as tmp_file:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise File_Too_Large(max_bytes=max_bytes)
+                digest.update(chunk)
+                await tmp_file.write(chunk)
+        key = content_key(prefix=prefix, digest=digest.hexdigest(), extension=extension)
+        await anyio.to_thread.run_sync(functools.partial(
+            _put_if_missing, storage=storage, key=key, source_path=tmp_path, content_type=upload.content_type
+        ))
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+    return key
+
+
+def delete_stored_image(*, image_path: str, img_variants: dict[str, str] | None = None) -> None:
+    '''
+    Removes a stored image and its variants, callers check first that no user references it.
+    Files outside the content addressed store (legacy names) are left alone.
+    '''
+    if not is_content_addressed(image_path):
+        return
+    storage = get_storage()
+    for key in [image_path, *(img_variants or {}).values()]:
+        storage.delete(key=key)
 
 # SINGLE IMAGE UPLOAD
 # ---------------------------------------------------------------------------------------------
 
-async def upload_image(*, image_const: ImageCons, image: UploadFile, image_name:str) -> str:
+async def upload_image(*, image_const: ImageCons, image: UploadFile) -> str:
     '''
-    Handle image uploads to the path specified in the settings image.
+    Handle image uploads to the storage backend in the settings.
     
     Returns
     ---
-    A string containing the image path or URL, in case the upload failed raises an exception. 
+    A string containing the image storage key, in case the upload failed raises an exception. 
     '''
     # Checking the constraints passed
     if image.content_type not in image_const.ALLOWED_CONTENT_TYPES:
         raise Unsupported_File(supported=image_const.ALLOWED_CONTENT_TYPES)
         
-    elif image.size > image_const.MAX_IMAGE_SIZE:
+    # Early rejection when the size is known, the limit is enforced again while streaming
+    elif image.size is not None and image.size > image_const.MAX_IMAGE_SIZE:
         raise File_Too_Large(max_bytes=image_const.MAX_IMAGE_SIZE)
         
-    # Change the image name but keep the extension
-    file_ext = image.filename.split('.')[-1]
-    image.filename = image_name + f'.{file_ext}'
+    # The file is named after its content, keeping the extension
+    file_ext = image.filename.split('.')[-1].lower()
     
-    if settings.ENVIRONMENT == "local": # Save file locally for local development
-        local_path = os.path.join('.', settings.UPLOADS_URL, image_const.UPLOAD_SUB_DIR, image.filename)
-        
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        
-        try:
-            with open(local_path, "wb") as local_file:
-                content = await image.read()
-                local_file.write(content)
-        except Exception as e:
-            raise Upload_Failed(e=e)
-
-        return local_path
-    
-    elif settings.ENVIRONMENT in ["production", "staging"]: # Save file to Google Cloud Storage for production or staging
+    try:
+        return await store_upload(upload=image, prefix=image_const.UPLOAD_SUB_DIR, extension=file_ext, max_bytes=image_const.MAX_IMAGE_SIZE)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise Upload_Failed(e=e)
 
-        # client = image.Client()
-        # bucket = client.bucket(settings.GCS_BUCKET_NAME)  # Bucket name should be set in your settings
-        # blob = bucket.blob(image.filename)
-        
-        # try:
-        #     blob.upload_from_string(await image.read(), content_type=image.content_type)
-        # except Exception as e:
-        #     raise exceptions.Upload_Failed(e=e)
-        
-        # return blob.public_url
-        pass
 
-    raise Invalid_Configuration()
\ No newline at end of file
+# IMAGE VARIANTS (THUMBNAILS)
+# ---------------------------------------------------------------------------------------------
+
+VARIANT_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+VARIANT_CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+_image_pool: ProcessPoolExecutor | None = None
+_image_pool_lock = threading.Lock()
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    '''Returns the process pool used to resize images, creating it on first use'''
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            # Spawned workers don't inherit the parent's threads or open connections
+            _image_pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _image_pool
+
+
+def shutdown_image_pool() -> None:
+    '''Stops the image workers, a new pool is created on the next resize'''
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is not None:
+            _image_pool.shutdown(wait=True, cancel_futures=True)
+            _image_pool = None
+
+
+def variant_path(*, image_path: str, size: int, image_format: str) -> str:
+    '''Path (or storage key) of the `size` variant, next to the original image'''
+    return f"{os.path.splitext(image_path)[0]}_{size}.{VARIANT_EXTENSIONS[image_format]}"
+
+
+def pick_variant_size(*, sizes: tuple[int, ...], requested: int) -> int:
+    '''Smallest variant covering the requested size, or the largest one'''
+    covering = [size for size in sizes if size >= requested]
+    return min(covering) if covering else max(sizes)
+
+
+def resize_image(image_path: str, sizes: tuple[int, ...], image_format: str, quality: int, output_dir: str) -> dict[str, str]:
+    '''
+    Writes the variants of the image fitting in `size` x `size` boxes (never upscaled) to
+    `output_dir`, run in the image process pool.
+
+    Returns
+    ---
+    The variants paths by size.
+    '''
+    variants = {}
+    with Image.open(image_path) as original:
+        # JPEG files are decoded already downscaled, close to the largest variant
+        original.draft("RGB", (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(original)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        # Each variant is resized from the previous (larger) one
+        for size in sorted(sizes, reverse=True):
+            image = image.copy()
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            path = variant_path(image_path=os.path.join(output_dir, os.path.basename(image_path)), size=size, image_format=image_format)
+            image.save(path, format=image_format, quality=quality)
+            variants[str(size)] = path
+    return variants
+
+
+def _resize_and_store(*, storage: StorageBackend, image_path: str, sizes: tuple[int, ...], image_format: str, quality: int) -> dict[str, str]:
+    with storage.open_local(key=image_path) as source_path, tempfile.TemporaryDirectory(dir=storage.staging_dir) as output_dir:
+        # Resized in the image process pool, this worker thread waits for the result
+        resized = get_image_pool().submit(resize_image, source_path, sizes, image_format, quality, output_dir).result()
+
+        variants = {}
+        for size, path in resized.items():
+            key = variant_path(image_path=image_path, size=int(size), image_format=image_format)
+            storage.put(key=key, source_path=path, content_type=VARIANT_CONTENT_TYPES[image_format])
+            variants[size] = key
+    return variants
+
+
+async def create_image_variants(*, image_const: ImageCons, image_path: str) -> dict[str, str] | None:
+    '''
+    Resizes an uploaded image to the `VARIANT_SIZES` of its constraints in the image process pool.
+
+    Returns
+    ---
+    The variants paths by size (None without variant sizes), raises Unsupported_File when the
+    upload is not a readable image.
+    '''
+    if not image_const.VARIANT_SIZES:
+        return None
+
+    # The variants of a stored image are content addressed too, identical uploads reuse them
+    storage = get_storage()
+    variants = {
+        str(size): variant_path(image_path=image_path, size=size, image_format=settings.IMAGE_VARIANT_FORMAT)
+        for size in image_const.VARIANT_SIZES
+    }
+    if is_content_addressed(image_path) and await anyio.to_thread.run_sync(
+        lambda: all(storage.exists(key=key) for key in variants.values())
+    ):
+        return variants
+
+    try:
+        return await anyio.to_thread.run_sync(functools.partial(
+            _resize_and_store,
+            storage=storage,
+            image_path=image_path,
+            sizes=tuple(image_const.VARIANT_SIZES),
+            image_format=settings.IMAGE_VARIANT_FORMAT,
+            quality=settings.IMAGE_VARIANT_QUALITY,
+        ))
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        # Not referenced by any user, identical bytes are rejected the same way
+        await anyio.to_thread.run_sync(functools.partial(delete_stored_image, image_path=image_path))
+        raise Unsupported_File(supported=image_const.ALLOWED_CONTENT_TYPES)
+    except OSError as e:
+        raise Upload_Failed(e=e)
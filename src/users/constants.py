@@ -6,9 +6,11 @@ from src.schemas import ImageCons
 ALLOWED_CONTENT_TYPES = ["image/png", "image/jpg", "image/jpeg"]
 MAX_IMAGE_SIZE = 2000000 # bytes
 UPLOAD_SUB_DIR = "user_imgs"
+VARIANT_SIZES = (64, 256, 1024) # px
 
 image_const = ImageCons(
     ALLOWED_CONTENT_TYPES=ALLOWED_CONTENT_TYPES,
     MAX_IMAGE_SIZE=MAX_IMAGE_SIZE,
-    UPLOAD_SUB_DIR=UPLOAD_SUB_DIR
+    UPLOAD_SUB_DIR=UPLOAD_SUB_DIR,
+    VARIANT_SIZES=VARIANT_SIZES
 )
\ No newline at end of file
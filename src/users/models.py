@@ -2,6 +2,7 @@ from datetime import date
 from pydantic_extra_types.phone_numbers import PhoneNumber
 from pydantic import EmailStr
 
+from sqlalchemy import Index, JSON, text
 from sqlmodel import Field, Relationship
 from sqlmodel import SQLModel
 
@@ -18,13 +19,26 @@ class BaseUser(SQLModel):
     last_name: str = Field(max_length=50)
     birthday: date
     phone_number: PhoneNumber
-    email: EmailStr = Field(max_length=50, nullable=False)
+    email: EmailStr = Field(max_length=50, nullable=False, index=True)
 
 class Users(BaseUser, table=True):
+    __table_args__ = (
+        # Partial index over the active (not terminated) users
+        Index(
+            "ix_users_active", 
+            "id", 
+            postgresql_where=text("terminated_at IS NULL"), 
+            sqlite_where=text("terminated_at IS NULL")
+        ),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     terminated_at: date | None = Field(default=None)
-    img_path: str | None = Field(default=None)
-    user_name: str = Field(max_length=50)
+    # Shared by users uploading identical images, counted before deleting the file
+    img_path: str | None = Field(default=None, index=True)
+    # Resized variants of the image, paths by size ("64", "256", ...)
+    img_variants: dict[str, str] | None = Field(default=None, sa_type=JSON)
+    user_name: str = Field(max_length=50, index=True, unique=True)
     hashed_password: str
     is_admin: bool | None = Field(default=False)
     is_owner: bool | None = Field(default=False)
@@ -32,7 +46,7 @@ class Users(BaseUser, table=True):
     register_date: date | None = Field(default_factory=lambda: date.today())
 
     # Relationships
-    roles_id: int = Field(foreign_key="roles.id", ondelete="RESTRICT")
+    roles_id: int = Field(foreign_key="roles.id", ondelete="RESTRICT", index=True)
     role: "Roles" = Relationship(back_populates="users")
 
 
@@ -1,20 +1,24 @@
 import mimetypes
-from typing import Any, Annotated
+from typing import Any, Annotated, Literal
 from fastapi import APIRouter, Depends, UploadFile, File, Form, Query
 from datetime import date
 from pydantic import EmailStr
-from fastapi.responses import FileResponse
-from pathlib import Path
-
-from src.uploads import upload_image
-from src.exceptions import Unsupported_File, File_Not_Found
+from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from src.config import settings
+from src.storage import LocalStorage, get_storage
+from src.uploads import upload_image, create_image_variants, variant_path, pick_variant_size, is_content_addressed, VARIANT_CONTENT_TYPES
+from src.exceptions import Unsupported_File, File_Not_Found, Invalid_Cursor
 from src.users import service, exceptions
-from src.dependencies import CurrentUser, SessionDep, get_current_active_admin, get_current_active_owner, get_current_user
+from src.dependencies import CurrentUser, AsyncSessionDep, get_current_active_admin, get_current_active_owner, get_current_user
 from src.schemas import Message
 
 from src.mail.utils import generate_new_account_email
-from src.mail.service import send_email
-from src.auth.service import verify_password
+from src.mail.queue import email_queue
+from src.auth.service import verify_password_async
 from src.users.models import Users, Roles
 from src.users.constants import image_const
 from src.users.schemas import(
@@ -45,14 +49,33 @@ user_routes = APIRouter()
     dependencies=[Depends(get_current_active_admin)], # Only admins can view users
     response_model=UsersPublic,
     )
-def read_users(*, session: SessionDep, skip: int = 0, limit: int = 10) -> Any:
+async def read_users(
+        *, 
+        session: AsyncSessionDep, 
+        skip: int = 0, 
+        limit: int = 10,
+        cursor: Annotated[str | None, Query(description="Cursor pagination, send it empty for the first page and then the returned `next_cursor`")] = None,
+        order_by: Annotated[Literal["id", "register_date", "last_name"], Query(description="Cursor pagination order")] = "id",
+    ) -> Any:
     '''
     Retrieve users
     '''
+    if cursor is not None:
+        # Cursor (keyset) pagination
+        after = service.decode_cursor(cursor=cursor, model=Users, order_by=order_by) if cursor else None
+        if cursor and after is None:
+            raise Invalid_Cursor()
+        count, users, next_cursor, count_estimated = await service.retrieve_page_async(
+            session=session, model=Users, limit=limit, after=after, order_by=order_by, options=[selectinload(Users.role)], count_strategy=settings.COUNT_STRATEGY
+        )
+        return UsersPublic(data=users, count=count, count_estimated=count_estimated, next_cursor=next_cursor)
+
     # Retrieving the count and users list from the database
-    count, users = service.retrieve_count(session=session, model=Users, skip=skip, limit=limit)
+    count, users, count_estimated = await service.retrieve_count_async(
+        session=session, model=Users, skip=skip, limit=limit, options=[selectinload(Users.role)], count_strategy=settings.COUNT_STRATEGY
+    )
     # Returning the users list and count
-    return UsersPublic(data=users, count=count) 
+    return UsersPublic(data=users, count=count, count_estimated=count_estimated) 
 
 
 @user_routes.post(
@@ -62,7 +85,7 @@ def read_users(*, session: SessionDep, skip: int = 0, limit: int = 10) -> Any:
 )
 async def create_user(
         *,
-        session:SessionDep, 
+        session: AsyncSessionDep, 
         first_name: Annotated[str, Form()],
         last_name: Annotated[str, Form()],
         phone_number: Annotated[str, Form()],
@@ -97,32 +120,34 @@ async def create_user(
         salary=salary
         )
 
-    user = service.get_user_by_username(session=session, user_name=user_in.user_name)
+    user = await service.get_user_by_username_async(session=session, user_name=user_in.user_name)
     if user:
         raise exceptions.User_Already_Exists()
     
-    role = service.get_role_by_name(session=session, role_name=role_name)
+    role = await service.get_role_by_name_async(session=session, role_name=role_name)
     
     if not role:
         raise exceptions.Role_Not_Found()
     
     if user_image:
-        filename = '_'.join([first_name.lower(), last_name.lower(), 'photo'])
-        img_path = await upload_image(image_const=image_const, image=user_image, image_name=filename)
+        img_path = await upload_image(image_const=image_const, image=user_image)
+        img_variants = await create_image_variants(image_const=image_const, image_path=img_path)
     else:
         img_path = None
+        img_variants = None
 
-    user = service.create_user(session=session, user_create=user_in, role=role, img_path=img_path)
+    try:
+        user = await service.create_user_async(session=session, user_create=user_in, role=role, img_path=img_path, img_variants=img_variants)
+    except IntegrityError:
+        # A concurrent request took the user name after the check above (unique index)
+        await session.rollback()
+        raise exceptions.User_Already_Exists()
 
     # Generating the email from template
     email_data = generate_new_account_email(email_to=user.email, username=user.user_name, password=password)
     
-    # Sending the email
-    send_email(
-        email_to=user.email,
-        subject=email_data.subject,
-        html_content=email_data.html_content
-    )
+    # Queuing the email, the delivery workers send it in the background
+    await email_queue.enqueue(session=session, email_to=user.email, email_data=email_data)
 
     return user
 
@@ -131,7 +156,7 @@ async def create_user(
         "/me", 
         response_model=UserPublicWithRoles
 )
-def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(current_user: CurrentUser) -> Any:
     '''
     Get current user
     '''
@@ -144,7 +169,7 @@ def read_user_me(current_user: CurrentUser) -> Any:
 )
 async def update_user_me(
     *, 
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: CurrentUser,
     # Optional update fields
     first_name: Annotated[str, Form()] = None,
@@ -178,17 +203,18 @@ async def update_user_me(
     user_in = UserUpdateMe(**not_empty_data)
 
     if user_in.username is not None:
-        existig_user = service.get_user_by_username(session=session, user_name=user_in.username)
+        existig_user = await service.get_user_by_username_async(session=session, user_name=user_in.username)
         if existig_user and existig_user.id != current_user.id:
             raise exceptions.User_Already_Exists()
         
     if user_image:
-        filename = '_'.join([current_user.first_name.lower(), current_user.last_name.lower(), 'photo'])
-        img_path = await upload_image(image_const=image_const, image=user_image, image_name=filename)
+        img_path = await upload_image(image_const=image_const, image=user_image)
+        img_variants = await create_image_variants(image_const=image_const, image_path=img_path)
     else:
         img_path = None
+        img_variants = None
         
-    db_user = service.update_user(session=session, db_user=current_user, user_in=user_in, img_path=img_path)
+    db_user = await service.update_user_async(session=session, db_user=current_user, user_in=user_in, img_path=img_path, img_variants=img_variants)
 
     return db_user
 
@@ -197,16 +223,16 @@ async def update_user_me(
         "/me/password", 
         response_model=Message
 )
-def update_password_me(*, session: SessionDep, body:UpdatePassword, current_user: CurrentUser) -> Any:
+async def update_password_me(*, session: AsyncSessionDep, body:UpdatePassword, current_user: CurrentUser) -> Any:
     '''
     Update own password
     '''
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await verify_password_async(body.current_password, current_user.hashed_password):
         raise exceptions.Incorrect_Password()
     if body.current_password == body.new_password:
         raise exceptions.Same_Password()
     
-    service.update_hash_password(session=session, db_user=current_user, password=body.new_password)
+    await service.update_hash_password_async(session=session, db_user=current_user, password=body.new_password)
     
     return Message(message="Password updated successfully!")
 
@@ -216,11 +242,11 @@ def update_password_me(*, session: SessionDep, body:UpdatePassword, current_user
         "/{user_id}", 
         response_model=Users
 )
-def read_user_by_id(*, user_id: int, session: SessionDep, current_user: CurrentUser) -> Any:
+async def read_user_by_id(*, user_id: int, session: AsyncSessionDep, current_user: CurrentUser) -> Any:
     '''
     Get a specific user by id.
     '''
-    user = service.get_user_by_id(session=session, user_id=user_id)
+    user = await service.get_user_by_id_async(session=session, user_id=user_id)
     
     if not user:
         raise exceptions.User_Not_Found()
@@ -241,7 +267,7 @@ def read_user_by_id(*, user_id: int, session: SessionDep, current_user: CurrentU
 )
 async def update_user(
         *, 
-        session: SessionDep, 
+        session: AsyncSessionDep, 
         user_id: int,
         # Optional update fields
         first_name: Annotated[str | None, Form()] = None,
@@ -262,7 +288,7 @@ async def update_user(
     '''
     Update a user (administrators and owners only).
     '''
-    db_user = service.get_user_by_id(session=session, user_id=user_id)
+    db_user = await service.get_user_by_id_async(session=session, user_id=user_id)
     if not db_user:
         raise exceptions.User_Not_Found()
     
@@ -285,26 +311,26 @@ async def update_user(
     user_in = UpdateUser(**not_empty_data)
 
     if user_name is not None:
-        existing_user = service.get_user_by_username(session=session, user_name=user_name)
+        existing_user = await service.get_user_by_username_async(session=session, user_name=user_name)
         if existing_user and existing_user.id != user_id:
             raise exceptions.Username_Conflict()
         
     # Get the role from the 'role_name' if passed, else set it to None
     if role_name is not None:
-        role = service.get_role_by_name(session=session, role_name=role_name)
+        role = await service.get_role_by_name_async(session=session, role_name=role_name)
         if not role:
             raise exceptions.Role_Not_Found()
     else:
         role = None
 
     if user_image:
-        # Getting the image name from the db_user
-        filename = '_'.join([db_user.first_name.lower(), db_user.last_name.lower(), 'photo'])
-        img_path = await upload_image(image_const=image_const, image=user_image, image_name=filename)
+        img_path = await upload_image(image_const=image_const, image=user_image)
+        img_variants = await create_image_variants(image_const=image_const, image_path=img_path)
     else:
         img_path = None
+        img_variants = None
 
-    db_user = service.update_user(session=session, db_user=db_user, user_in=user_in, role=role, img_path=img_path)
+    db_user = await service.update_user_async(session=session, db_user=db_user, user_in=user_in, role=role, img_path=img_path, img_variants=img_variants)
     return db_user
 
 
@@ -312,18 +338,18 @@ async def update_user(
         "/{user_id}", 
         dependencies=[Depends(get_current_active_owner)] # Only owners can delete users
 )
-def delete_user(*, session: SessionDep, current_user: CurrentUser, user_id: int) -> Message:
+async def delete_user(*, session: AsyncSessionDep, current_user: CurrentUser, user_id: int) -> Message:
     '''
     Delete a user (owners only).
     '''
-    user = service.get_user_by_id(session=session, user_id=user_id)
+    user = await service.get_user_by_id_async(session=session, user_id=user_id)
     if not user:
         raise exceptions.User_Not_Found()
     
     if user == current_user:
         raise exceptions.Self_Delete()
     
-    message = service.delete_user(session=session, db_user=user)
+    message = await service.delete_user_async(session=session, db_user=user)
     
     return Message(message=message)
 
@@ -332,11 +358,11 @@ def delete_user(*, session: SessionDep, current_user: CurrentUser, user_id: int)
         "/{user_id}/terminate",
         dependencies=[Depends(get_current_active_owner)], # Only owners can terminate a user
 )
-def terminate_user(*, session:SessionDep, user_id: int, terminate: bool = False, current_user: CurrentUser) -> Message:
+async def terminate_user(*, session: AsyncSessionDep, user_id: int, terminate: bool = False, current_user: CurrentUser) -> Message:
     '''
     Terminate a user (owners only)
     '''
-    db_user = service.get_user_by_id(session=session, user_id=user_id)
+    db_user = await service.get_user_by_id_async(session=session, user_id=user_id)
     
     if not db_user:
         raise exceptions.User_Not_Found()
@@ -345,7 +371,7 @@ def terminate_user(*, session:SessionDep, user_id: int, terminate: bool = False,
         raise exceptions.Self_Termination()
     
     if terminate:
-        message = service.terminate_user(session=session, db_user=db_user)
+        message = await service.terminate_user_async(session=session, db_user=db_user)
     else:
         message = f"User '{db_user.user_name}' not terminated"
 
@@ -365,17 +391,38 @@ roles_routes = APIRouter()
         dependencies=[Depends(get_current_active_admin)], # Only admins can view roles
         response_model=RolesPublic | RolesNames
 )
-def read_roles(*, session: SessionDep, skip: int = 0, limit: int = 10, just_names: bool = False) -> Any:
+async def read_roles(
+        *, 
+        session: AsyncSessionDep, 
+        skip: int = 0, 
+        limit: int = 10, 
+        just_names: bool = False,
+        cursor: Annotated[str | None, Query(description="Cursor pagination, send it empty for the first page and then the returned `next_cursor`")] = None,
+    ) -> Any:
     '''
     Retrieve roles (owners and admins only)
     '''
+    if cursor is not None:
+        # Cursor (keyset) pagination ordered by id
+        after = service.decode_cursor(cursor=cursor, model=Roles, order_by="id") if cursor else None
+        if cursor and after is None:
+            raise Invalid_Cursor()
+        count, roles, next_cursor, count_estimated = await service.retrieve_page_async(
+            session=session, model=Roles, limit=limit, after=after, options=[] if just_names else [selectinload(Roles.users)], count_strategy=settings.COUNT_STRATEGY
+        )
+        if just_names:
+            return RolesNames(role_names=[record.name for record in roles], next_cursor=next_cursor)
+        return RolesPublic(data=roles, count=count, count_estimated=count_estimated, next_cursor=next_cursor)
+
         # Retrieving the count and users list from the database
-    count, roles = service.retrieve_count(session=session, model=Roles, skip=skip, limit=limit)
+    count, roles, count_estimated = await service.retrieve_count_async(
+        session=session, model=Roles, skip=skip, limit=limit, options=[] if just_names else [selectinload(Roles.users)], count_strategy=settings.COUNT_STRATEGY
+    )
 
     if just_names:
         return RolesNames(role_names=[record.name for record in roles])
 
-    return RolesPublic(data=roles, count=count) # Returning the roles' list and count
+    return RolesPublic(data=roles, count=count, count_estimated=count_estimated) # Returning the roles' list and count
 
 
 @roles_routes.post(
@@ -383,16 +430,16 @@ def read_roles(*, session: SessionDep, skip: int = 0, limit: int = 10, just_name
     dependencies=[Depends(get_current_active_admin)], # Only admins can create roles
     response_model=RolePublicWithoutUsers
 )
-def create_role(*, session:SessionDep, role_in: CreateRole) -> Any:
+async def create_role(*, session: AsyncSessionDep, role_in: CreateRole) -> Any:
     '''
     Create a role (owners and admins only)
     '''
-    role = service.get_role_by_name(session=session, role_name=role_in.name)
+    role = await service.get_role_by_name_async(session=session, role_name=role_in.name)
 
     if role:
         raise exceptions.Role_Name_Conflict()
     
-    role = service.create_role(session=session, role_create=role_in)
+    role = await service.create_role_async(session=session, role_create=role_in)
     
     return role
 
@@ -402,11 +449,11 @@ def create_role(*, session:SessionDep, role_in: CreateRole) -> Any:
     dependencies=[Depends(get_current_active_admin)], # Only admins can view roles
     response_model=RolePublic
 )
-def read_role_by_id(*, session:SessionDep, role_id: int) -> Any:
+async def read_role_by_id(*, session: AsyncSessionDep, role_id: int) -> Any:
     '''
     Retrieve role by id (owners and admins only)
     '''
-    role = service.get_role_by_id(session=session, role_id=role_id)
+    role = await service.get_role_by_id_async(session=session, role_id=role_id, options=[selectinload(Roles.users)])
 
     if not role:
         raise exceptions.Role_Not_Found()
@@ -419,22 +466,22 @@ def read_role_by_id(*, session:SessionDep, role_id: int) -> Any:
     dependencies=[Depends(get_current_active_admin)], # Only admins can modify roles
     response_model=RolePublicWithoutUsers
 )
-def update_role(*, session: SessionDep, role_id: int, role_in: UpdateRole) -> Any:
+async def update_role(*, session: AsyncSessionDep, role_id: int, role_in: UpdateRole) -> Any:
     '''
     Update Role (owners and admins only)
     '''
-    db_role = service.get_role_by_id(session=session, role_id=role_id)
+    db_role = await service.get_role_by_id_async(session=session, role_id=role_id)
 
     if not db_role:
         raise exceptions.Role_Not_Found()
     
     if role_in.name:
-        existing_role = service.get_role_by_name(session=session, role_name=role_in.name)
+        existing_role = await service.get_role_by_name_async(session=session, role_name=role_in.name)
         
         if existing_role and existing_role.id != db_role.id:
             raise exceptions.Role_Already_Exists()
 
-    db_role = service.update_role(session=session, db_role=db_role, role_in=role_in)
+    db_role = await service.update_role_async(session=session, db_role=db_role, role_in=role_in)
 
     return db_role
 
@@ -443,11 +490,11 @@ def update_role(*, session: SessionDep, role_id: int, role_in: UpdateRole) -> An
     "/{role_id}",
     dependencies=[Depends(get_current_active_admin)] # Only admins can delete roles
 )
-def delete_roles(*, session: SessionDep, role_id: int) -> Any:
+async def delete_roles(*, session: AsyncSessionDep, role_id: int) -> Any:
     '''
     Delete a role (owners and admins only)
     '''
-    role = service.get_role_by_id(session=session, role_id=role_id)
+    role = await service.get_role_by_id_async(session=session, role_id=role_id, options=[selectinload(Roles.users)])
     if not role:
         raise exceptions.Role_Not_Found()
     
@@ -455,7 +502,7 @@ def delete_roles(*, session: SessionDep, role_id: int) -> Any:
     if len(role.users) > 0:
         raise exceptions.Role_In_Use()
     
-    message = service.delete_role(session=session, db_role=role)
+    message = await service.delete_role_async(session=session, db_role=role)
 
     return Message(message=message)
 
@@ -470,22 +517,41 @@ files_router = APIRouter()
     dependencies=[Depends(get_current_user)], # For users only
     response_class=FileResponse
 )
-async def fetch_file(*, path: str = Query(...)) -> Any:
+async def fetch_file(
+        *, 
+        path: str = Query(...), 
+        size: int | None = Query(default=None, gt=0, description="Serve the smallest resized variant covering this size (px), if available")
+    ) -> Any:
     '''
-    File fetching endpoint (development only)
+    File fetching endpoint, `path` is the storage key of the file
     '''
-    # Getting the path
-    image_path = Path(path)
+    storage = get_storage()
 
-    if not image_path.is_file():
+    # Swapping the original for a resized variant, the original is served for images without variants
+    if size is not None and image_const.VARIANT_SIZES:
+        variant_size = pick_variant_size(sizes=image_const.VARIANT_SIZES, requested=size)
+        image_variant = variant_path(image_path=path, size=variant_size, image_format=settings.IMAGE_VARIANT_FORMAT)
+        if await run_in_threadpool(storage.exists, key=image_variant):
+            path = image_variant
+
+    if not await run_in_threadpool(storage.exists, key=path):
         raise File_Not_Found()
 
     # Getting the image name and type
     image_name = path.split("/")[-1]
-    image_type, _ = mimetypes.guess_type(url=image_path)
+    image_type, _ = mimetypes.guess_type(url=path)
 
-    if image_type not in image_const.ALLOWED_CONTENT_TYPES:
+    if image_type not in image_const.ALLOWED_CONTENT_TYPES and image_type != VARIANT_CONTENT_TYPES[settings.IMAGE_VARIANT_FORMAT]:
         raise Unsupported_File()
+
+    # Object storage serves the bytes itself, through a short lived URL
+    if not isinstance(storage, LocalStorage):
+        return RedirectResponse(
+            url=storage.presign(key=path, expires_in=settings.STORAGE_PRESIGN_EXPIRES_SECONDS), status_code=307
+        )
     
-    image = FileResponse(path=path, media_type=image_type, filename=image_name)
+    # Content addressed files never change, clients can keep them for good
+    headers = {"Cache-Control": "private, max-age=31536000, immutable"} if is_content_addressed(path) else None
+
+    image = FileResponse(path=storage.path(path), media_type=image_type, filename=image_name, headers=headers)
     return image
\ No newline at end of file
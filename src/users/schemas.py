@@ -80,6 +80,7 @@ class UserPublicWithRoles(BaseUser): # User with roles
     register_date: date | None
     terminated_at: date | None
     img_path: str | None
+    img_variants: dict[str, str] | None = None
     user_name: str
     is_admin: bool
     is_owner: bool
@@ -91,6 +92,7 @@ class UserPublicWithoutRoles(BaseUser): # User without roles
     register_date: date | None
     terminated_at: date | None
     img_path: str | None
+    img_variants: dict[str, str] | None = None
     user_name: str
     is_admin: bool
     is_owner: bool
@@ -99,6 +101,8 @@ class UserPublicWithoutRoles(BaseUser): # User without roles
 class UsersPublic(SQLModel): # List of users with roles
     data: list[UserPublicWithRoles]
     count: int
+    count_estimated: bool = False # True when count comes from the planner statistics
+    next_cursor: str | None = None # Only set in cursor pagination mode
 
 # Roles
 
@@ -112,6 +116,9 @@ class RolePublicWithoutUsers(BaseRolDep):
 class RolesPublic(SQLModel): # List of RolePublic objects
     data: list[RolePublic]
     count: int
+    count_estimated: bool = False # True when count comes from the planner statistics
+    next_cursor: str | None = None # Only set in cursor pagination mode
 
 class RolesNames(SQLModel): # List of Role's names
     role_names: list[str]
+    next_cursor: str | None = None # Only set in cursor pagination mode
@@ -1,26 +1,40 @@
+import json
+import time
+import base64
+import binascii
 import datetime
-from typing import Any, Type
+import functools
+import threading
+from typing import Any, Type, Sequence, Literal
+from anyio import to_thread
+from sqlalchemy import tuple_, text
+from sqlalchemy.orm.interfaces import LoaderOption
 from sqlmodel import Session, select, SQLModel, func
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from src.auth.service import get_password_hash, verify_password
+from src.config import settings
+from src.auth.service import get_password_hash_async, verify_password_async
+from src.uploads import delete_stored_image
 from src.users.models import Users, Roles
 from src.users.schemas import UpdateUser, CreateUser, UpdateRole
 
 # Users CRUD
 # ---------------------------------------------------------------------------------------------
 
-def create_user(*, session: Session, user_create: CreateUser, role: Roles, img_path: str | None = None) -> Users:
+async def create_user(*, session: Session, user_create: CreateUser, role: Roles, img_path: str | None = None, img_variants: dict[str, str] | None = None) -> Users:
+    hashed_password = await get_password_hash_async(user_create.password)
     if img_path:
         db_obj = Users.model_validate(
-            user_create, update={"hashed_password": get_password_hash(user_create.password), "roles_id": role.id, "img_path":img_path}
+            user_create, update={"hashed_password": hashed_password, "roles_id": role.id, "img_path":img_path, "img_variants":img_variants}
         )
     else:
         db_obj = Users.model_validate(
-            user_create, update={"hashed_password": get_password_hash(user_create.password), "roles_id": role.id}
+            user_create, update={"hashed_password": hashed_password, "roles_id": role.id}
         )
     session.add(db_obj)
     session.commit()
     session.refresh(db_obj)
+    invalidate_count(model=Users)
     return db_obj
 
 
@@ -31,23 +45,24 @@ def get_user_by_username(*, session: Session, user_name: str) -> Users | None:
     return session_user
 
 
-def get_user_by_id(*, session: Session, user_id: int) -> Users | None:
-    session_user = session.get(Users, user_id)
+def get_user_by_id(*, session: Session, user_id: int, options: Sequence[LoaderOption] = ()) -> Users | None:
+    session_user = session.get(Users, user_id, options=options)
     return session_user
 
 
-def update_user(*, session: Session, db_user: Users, user_in: UpdateUser, role: Roles | None = None, img_path:str | None = None) -> Any:
+async def update_user(*, session: Session, db_user: Users, user_in: UpdateUser, role: Roles | None = None, img_path:str | None = None, img_variants: dict[str, str] | None = None) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
 
     if "password" in user_data:
         password = user_data["password"]
-        hashed_password = get_password_hash(password)
+        hashed_password = await get_password_hash_async(password)
         extra_data["hashed_password"] = hashed_password # Save hashed password
     
-    # Adding the image path if it is passed 
+    # Adding the image path (and its variants) if it is passed 
     if img_path: 
         extra_data["img_path"] = img_path
+        extra_data["img_variants"] = img_variants
     
     if role:
         # Append the user to the role and add it to the session
@@ -62,8 +77,8 @@ def update_user(*, session: Session, db_user: Users, user_in: UpdateUser, role:
     return db_user
 
 
-def update_hash_password(*, session: Session, db_user: Users, password: str) -> str:
-    hashed_password = get_password_hash(password=password)
+async def update_hash_password(*, session: Session, db_user: Users, password: str) -> str:
+    hashed_password = await get_password_hash_async(password=password)
     db_user.hashed_password = hashed_password
     session.add(db_user)
     session.commit()
@@ -83,15 +98,16 @@ def terminate_user(*, session: Session, db_user: Users) -> str:
 def delete_user(*, session: Session, db_user: Users) -> str:
     session.delete(db_user)
     session.commit()
+    invalidate_count(model=Users)
 
     return f"User '{db_user.user_name}' deleted successfully!"
 
 
-def authenticate(*, session: Session, user_name: str, password: str) -> Users | None:
+async def authenticate(*, session: Session, user_name: str, password: str) -> Users | None:
     db_user = get_user_by_username(session=session, user_name=user_name)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    if not await verify_password_async(password, db_user.hashed_password):
         return None
     
     return db_user
@@ -105,6 +121,7 @@ def create_role(*, session:Session, role_create:Roles):
     session.add(role_obj)
     session.commit()
     session.refresh(role_obj)
+    invalidate_count(model=Roles)
     
     return role_obj
 
@@ -114,8 +131,8 @@ def get_role_by_name(*, session: Session, role_name: str) -> Roles | None:
     
     return session_role
 
-def get_role_by_id(*, session: Session, role_id: int) -> Roles | None:
-    session_role = session.get(Roles, role_id)
+def get_role_by_id(*, session: Session, role_id: int, options: Sequence[LoaderOption] = ()) -> Roles | None:
+    session_role = session.get(Roles, role_id, options=options)
 
     return session_role
 
@@ -132,6 +149,7 @@ def update_role(*, session: Session, db_role: Roles, role_in: UpdateRole) -> Any
 def delete_role(*, session: Session, db_role: Roles) -> str:
     session.delete(db_role)
     session.commit()
+    invalidate_count(model=Roles)
     
     return f"Role '{db_role.name}' deleted successfully!"
 
@@ -139,20 +157,378 @@ def delete_role(*, session: Session, db_role: Roles) -> str:
 # General service
 # ---------------------------------------------------------------------------------------------
 
-def retrieve_count(*, session: Session, model: Type[SQLModel] , skip: int, limit: int) -> tuple[int, Any]:
+CountStrategy = Literal["exact", "cached", "estimate"]
+
+# Exact counts cached per table name: (count, expires_at)
+_count_cache: dict[str, tuple[int, float]] = {}
+_count_cache_lock = threading.Lock()
+
+
+# Planner row estimate, -1 if the table was never analyzed
+_ESTIMATE_STATEMENT = text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)")
+
+
+def invalidate_count(*, model: Type[SQLModel]) -> None:
+    '''Drops the cached count of the model, call it after creating or deleting records'''
+    with _count_cache_lock:
+        _count_cache.pop(model.__tablename__, None)
+
+
+def _get_cached_count(*, table_name: str) -> int | None:
+    with _count_cache_lock:
+        cached = _count_cache.get(table_name)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return None
+
+
+def _set_cached_count(*, table_name: str, count: int) -> None:
+    with _count_cache_lock:
+        _count_cache[table_name] = (count, time.monotonic() + settings.COUNT_CACHE_TTL_SECONDS)
+
+
+def count_records(*, session: Session, model: Type[SQLModel], strategy: CountStrategy = "exact") -> tuple[int, bool]:
     '''
-    Function that counts and retrieves the records of the passed model.
+    Counts the records of the passed model using the strategy:
+    - "exact": `SELECT count(*)` over the table.
+    - "cached": exact count reused for `COUNT_CACHE_TTL_SECONDS`, invalidated on create and delete.
+    - "estimate": row estimate from the Postgres planner (`pg_class.reltuples`), falls back to
+      an exact count on other databases or tables that were never analyzed.
 
     Returns:
     ---
     count: number of records in the database.
-    records: list of record objects from the database.
+    estimated: True if the count is the planner estimate.
     '''
+    table_name = model.__tablename__
+
+    if strategy == "estimate" and session.get_bind().dialect.name == "postgresql":
+        estimate = session.exec(statement=_ESTIMATE_STATEMENT, params={"table_name": table_name}).scalar()
+        if estimate is not None and estimate >= 0:
+            return estimate, True
+
+    if strategy == "cached":
+        cached = _get_cached_count(table_name=table_name)
+        if cached is not None:
+            return cached, False
+
     # Counting the records registered in the db
     count_statement = select(func.count()).select_from(model)
     count = session.exec(statement=count_statement).one()
+
+    if strategy == "cached":
+        _set_cached_count(table_name=table_name, count=count)
+
+    return count, False
+
+
+def retrieve_count(*, session: Session, model: Type[SQLModel] , skip: int, limit: int, options: Sequence[LoaderOption] = (), count_strategy: CountStrategy = "exact") -> tuple[int, Any, bool]:
+    '''
+    Function that counts and retrieves the records of the passed model.
+
+    Pass loader strategies in `options` (e.g. `selectinload(Users.role)`) to eager load the
+    relationships that will be serialized, instead of one lazy SELECT per record.
+
+    The count is obtained with `count_records` and the passed `count_strategy`.
+
+    Returns:
+    ---
+    count: number of records in the database.
+    records: list of record objects from the database.
+    count_estimated: True if the count is the planner estimate.
+    '''
+    # Counting the records registered in the db
+    count, count_estimated = count_records(session=session, model=model, strategy=count_strategy)
     # Retrieving the records (max. 10)
-    statement = select(model).offset(skip).limit(limit)
+    statement = select(model).options(*options).offset(skip).limit(limit)
     records = session.exec(statement=statement).all()
     
-    return count, records
\ No newline at end of file
+    return count, records, count_estimated
+
+
+def encode_cursor(*, order_by: str, value: Any, last_id: int) -> str:
+    '''
+    Builds the opaque cursor pointing after the record with `last_id` and `value` in the `order_by` column.
+    '''
+    payload = json.dumps({"order_by": order_by, "value": value, "id": last_id}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(*, cursor: str, model: Type[SQLModel], order_by: str) -> tuple[Any, int] | None:
+    '''
+    Reads a cursor created by `encode_cursor` for the same model and ordering.
+
+    Returns:
+    ---
+    (value, last_id) of the last record of the previous page, None if the cursor is invalid.
+    '''
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if payload["order_by"] != order_by:
+            return None
+        value, last_id = payload["value"], int(payload["id"])
+        # Restoring the column's python type (dates travel as ISO strings)
+        try:
+            python_type = getattr(model, order_by).type.python_type
+        except NotImplementedError: # Types without a python type (e.g. AutoString) travel as is
+            python_type = None
+        if value is not None and hasattr(python_type, "fromisoformat"):
+            value = python_type.fromisoformat(value)
+        elif value is not None and python_type is not None:
+            value = python_type(value)
+        return value, last_id
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError, KeyError, AttributeError):
+        return None
+
+
+def retrieve_page(*, session: Session, model: Type[SQLModel], limit: int, after: tuple[Any, int] | None = None, order_by: str = "id", options: Sequence[LoaderOption] = (), count_strategy: CountStrategy = "exact") -> tuple[int, Any, str | None, bool]:
+    '''
+    Keyset (cursor) pagination variant of `retrieve_count`, the page starts right after the
+    `after` position (decoded with `decode_cursor`) instead of skipping records with OFFSET.
+    Records are ordered by the `order_by` column and then by id.
+
+    Returns:
+    ---
+    count: number of records in the database.
+    records: list of record objects from the database.
+    next_cursor: cursor for the following page, None on the last page.
+    count_estimated: True if the count is the planner estimate.
+    '''
+    count, count_estimated = count_records(session=session, model=model, strategy=count_strategy)
+    statement = _page_statement(model=model, limit=limit, after=after, order_by=order_by, options=options)
+    records, next_cursor = _split_page(records=session.exec(statement=statement).all(), limit=limit, order_by=order_by)
+
+    return count, records, next_cursor, count_estimated
+
+
+def _page_statement(*, model: Type[SQLModel], limit: int, after: tuple[Any, int] | None, order_by: str, options: Sequence[LoaderOption]) -> Any:
+    column = getattr(model, order_by)
+    statement = select(model).options(*options)
+    if order_by == "id":
+        statement = statement.order_by(model.id)
+        if after:
+            statement = statement.where(model.id > after[1])
+    else:
+        statement = statement.order_by(column, model.id)
+        if after:
+            statement = statement.where(tuple_(column, model.id) > tuple_(*after))
+    # Fetching an extra record to know if there is a next page
+    return statement.limit(limit + 1)
+
+
+def _split_page(*, records: Sequence[Any], limit: int, order_by: str) -> tuple[Sequence[Any], str | None]:
+    if len(records) <= limit:
+        return records, None
+    records = records[:limit]
+    last = records[-1]
+    return records, encode_cursor(order_by=order_by, value=getattr(last, order_by), last_id=last.id)
+
+##=============================================================================================
+## ASYNC SESSION VARIANTS
+##=============================================================================================
+
+# Same behaviour as the functions above but for an `AsyncSession`, relationships are not lazy
+# loaded with it, so the ones that will be serialized are loaded explicitly.
+
+# Users CRUD
+# ---------------------------------------------------------------------------------------------
+
+async def create_user_async(*, session: AsyncSession, user_create: CreateUser, role: Roles, img_path: str | None = None, img_variants: dict[str, str] | None = None) -> Users:
+    hashed_password = await get_password_hash_async(user_create.password)
+    if img_path:
+        db_obj = Users.model_validate(
+            user_create, update={"hashed_password": hashed_password, "roles_id": role.id, "img_path":img_path, "img_variants":img_variants}
+        )
+    else:
+        db_obj = Users.model_validate(
+            user_create, update={"hashed_password": hashed_password, "roles_id": role.id}
+        )
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj, attribute_names=["role"])
+    invalidate_count(model=Users)
+    return db_obj
+
+
+async def get_user_by_username_async(*, session: AsyncSession, user_name: str) -> Users | None:
+    statement = select(Users).where(Users.user_name == user_name)
+    session_user = (await session.exec(statement)).first()
+
+    return session_user
+
+
+async def get_user_by_id_async(*, session: AsyncSession, user_id: int, options: Sequence[LoaderOption] = ()) -> Users | None:
+    session_user = await session.get(Users, user_id, options=options)
+    return session_user
+
+
+async def update_user_async(*, session: AsyncSession, db_user: Users, user_in: UpdateUser, role: Roles | None = None, img_path:str | None = None, img_variants: dict[str, str] | None = None) -> Any:
+    user_data = user_in.model_dump(exclude_unset=True)
+    extra_data = {}
+
+    if "password" in user_data:
+        password = user_data["password"]
+        hashed_password = await get_password_hash_async(password)
+        extra_data["hashed_password"] = hashed_password # Save hashed password
+
+    # Adding the image path (and its variants) if it is passed
+    previous_image = (db_user.img_path, db_user.img_variants)
+    if img_path:
+        extra_data["img_path"] = img_path
+        extra_data["img_variants"] = img_variants
+
+    if role:
+        # Linking the role by id, appending to `role.users` would load the whole collection
+        extra_data["roles_id"] = role.id
+
+    db_user.sqlmodel_update(user_data, update=extra_data)
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    await session.refresh(db_user, attribute_names=["role"])
+
+    # Removing the replaced image when no other user shares it
+    if img_path and previous_image[0] and previous_image[0] != img_path:
+        await release_image_async(session=session, image_path=previous_image[0], img_variants=previous_image[1])
+
+    return db_user
+
+
+async def update_hash_password_async(*, session: AsyncSession, db_user: Users, password: str) -> str:
+    hashed_password = await get_password_hash_async(password=password)
+    db_user.hashed_password = hashed_password
+    session.add(db_user)
+    await session.commit()
+
+    return "Password updated successfully!"
+
+
+async def terminate_user_async(*, session: AsyncSession, db_user: Users) -> str:
+    db_user.terminated_at = datetime.date.today()
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+
+    return f"User '{db_user.user_name}' terminated!"
+
+
+async def delete_user_async(*, session: AsyncSession, db_user: Users) -> str:
+    await session.delete(db_user)
+    await session.commit()
+    invalidate_count(model=Users)
+    if db_user.img_path:
+        await release_image_async(session=session, image_path=db_user.img_path, img_variants=db_user.img_variants)
+
+    return f"User '{db_user.user_name}' deleted successfully!"
+
+
+async def count_image_references_async(*, session: AsyncSession, image_path: str) -> int:
+    statement = select(func.count()).select_from(Users).where(Users.img_path == image_path)
+    return (await session.exec(statement)).one()
+
+
+async def release_image_async(*, session: AsyncSession, image_path: str, img_variants: dict[str, str] | None = None) -> bool:
+    '''
+    Deletes a stored image (and its variants) once no user references it, identical uploads
+    share the same file.
+
+    Returns
+    ---
+    True when the files were deleted.
+    '''
+    if await count_image_references_async(session=session, image_path=image_path) > 0:
+        return False
+    await to_thread.run_sync(functools.partial(delete_stored_image, image_path=image_path, img_variants=img_variants))
+    return True
+
+
+async def authenticate_async(*, session: AsyncSession, user_name: str, password: str) -> Users | None:
+    db_user = await get_user_by_username_async(session=session, user_name=user_name)
+    if not db_user:
+        return None
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+
+    return db_user
+
+
+# Roles CRUD
+# ---------------------------------------------------------------------------------------------
+
+async def create_role_async(*, session: AsyncSession, role_create: Roles):
+    role_obj = Roles.model_validate(role_create)
+    session.add(role_obj)
+    await session.commit()
+    await session.refresh(role_obj)
+    invalidate_count(model=Roles)
+
+    return role_obj
+
+async def get_role_by_name_async(*, session: AsyncSession, role_name: str) -> Roles | None:
+    statement = select(Roles).where(Roles.name == role_name)
+    session_role = (await session.exec(statement)).first()
+
+    return session_role
+
+async def get_role_by_id_async(*, session: AsyncSession, role_id: int, options: Sequence[LoaderOption] = ()) -> Roles | None:
+    session_role = await session.get(Roles, role_id, options=options)
+
+    return session_role
+
+async def update_role_async(*, session: AsyncSession, db_role: Roles, role_in: UpdateRole) -> Any:
+    role_data = role_in.model_dump(exclude_unset=True)
+    db_role.sqlmodel_update(role_data) # Update the role with the passed data
+    db_role.date_created = datetime.date.today() # Update the creation date
+    session.add(db_role)
+    await session.commit()
+    await session.refresh(db_role)
+
+    return db_role
+
+async def delete_role_async(*, session: AsyncSession, db_role: Roles) -> str:
+    await session.delete(db_role)
+    await session.commit()
+    invalidate_count(model=Roles)
+
+    return f"Role '{db_role.name}' deleted successfully!"
+
+
+# General service
+# ---------------------------------------------------------------------------------------------
+
+async def count_records_async(*, session: AsyncSession, model: Type[SQLModel], strategy: CountStrategy = "exact") -> tuple[int, bool]:
+    table_name = model.__tablename__
+
+    if strategy == "estimate" and session.get_bind().dialect.name == "postgresql":
+        estimate = (await session.exec(statement=_ESTIMATE_STATEMENT, params={"table_name": table_name})).scalar()
+        if estimate is not None and estimate >= 0:
+            return estimate, True
+
+    if strategy == "cached":
+        cached = _get_cached_count(table_name=table_name)
+        if cached is not None:
+            return cached, False
+
+    count_statement = select(func.count()).select_from(model)
+    count = (await session.exec(statement=count_statement)).one()
+
+    if strategy == "cached":
+        _set_cached_count(table_name=table_name, count=count)
+
+    return count, False
+
+
+async def retrieve_count_async(*, session: AsyncSession, model: Type[SQLModel] , skip: int, limit: int, options: Sequence[LoaderOption] = (), count_strategy: CountStrategy = "exact") -> tuple[int, Any, bool]:
+    count, count_estimated = await count_records_async(session=session, model=model, strategy=count_strategy)
+    statement = select(model).options(*options).offset(skip).limit(limit)
+    records = (await session.exec(statement=statement)).all()
+
+    return count, records, count_estimated
+
+
+async def retrieve_page_async(*, session: AsyncSession, model: Type[SQLModel], limit: int, after: tuple[Any, int] | None = None, order_by: str = "id", options: Sequence[LoaderOption] = (), count_strategy: CountStrategy = "exact") -> tuple[int, Any, str | None, bool]:
+    count, count_estimated = await count_records_async(session=session, model=model, strategy=count_strategy)
+    statement = _page_statement(model=model, limit=limit, after=after, order_by=order_by, options=options)
+    records, next_cursor = _split_page(records=(await session.exec(statement=statement)).all(), limit=limit, order_by=order_by)
+
+    return count, records, next_cursor, count_estimated
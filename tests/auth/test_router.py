@@ -3,8 +3,8 @@ from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
 from src.config import settings
-from src.auth.service import generate_password_reset_token, verify_password_reset_token
-from src.users.service import verify_password, get_user_by_username
+from src.auth.service import generate_password_reset_token, verify_password_reset_token, verify_password
+from src.users.service import get_user_by_username
 
 from tests.utils import random_lower_string
 
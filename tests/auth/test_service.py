@@ -1,9 +1,13 @@
 import pytest
+import asyncio
+import threading
 from datetime import datetime, timedelta, timezone
 import jwt
+from fastapi import HTTPException
 
 from src.config import settings
-from src.auth.service import create_access_token, ALGORITHM, generate_password_reset_token, verify_password_reset_token
+from src.auth import service
+from src.auth.service import create_access_token, ALGORITHM, generate_password_reset_token, verify_password_reset_token, get_password_hash_async, verify_password_async, verify_password
 from tests.auth.utils import get_data
 
 ##=============================================================================================
@@ -139,4 +143,28 @@ def test_verify_password_reset_token_malformed():
     malformed_token = "this_is_not_a_valid_token"
 
     result = verify_password_reset_token(malformed_token)
-    assert result is None
\ No newline at end of file
+    assert result is None
+
+
+# Password hashing process pool tests
+# ---------------------------------------------------------------------------------------------
+
+# Test hashing and verifying in the process pool
+def test_password_hash_async() -> None:
+    hashed_password = asyncio.run(get_password_hash_async("password123"))
+
+    assert verify_password("password123", hashed_password)
+    assert asyncio.run(verify_password_async("password123", hashed_password))
+    assert not asyncio.run(verify_password_async("wrong password", hashed_password))
+
+
+# Test rejecting new hashing jobs when the pool and the queue are full
+def test_password_hash_async_pool_full(monkeypatch: pytest.MonkeyPatch) -> None:
+    full_slots = threading.BoundedSemaphore(1)
+    full_slots.acquire()
+    monkeypatch.setattr(service, "_hash_slots", full_slots)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(get_password_hash_async("password123"))
+
+    assert e.value.status_code == 503
@@ -1,16 +1,19 @@
 import pytest
+import asyncio
 import pathlib
 
-from collections.abc import Generator
+from collections.abc import Generator, AsyncGenerator
 from fastapi.testclient import TestClient
 from sqlmodel import Session, create_engine, SQLModel
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import StaticPool
+from sqlalchemy import StaticPool, NullPool, Engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.main import app
 from src.config import settings
 from src.initial_data import init_db
-from src.dependencies import get_db
+from src.dependencies import get_db, get_async_db
 
 from tests.utils import (
     get_superuser_token_headers, 
@@ -32,8 +35,9 @@ def set_testing_env():
     yield
     settings.TEST = False
 
-# Creating a fake in memory data base
-SQL_MOCK_DATA_BASE = "sqlite:///:memory:"
+# Creating a fake in memory data base, shared by name between the sync and async engines
+SQL_MOCK_DATA_BASE = "sqlite:///file:test_db?mode=memory&cache=shared&uri=true"
+ASYNC_SQL_MOCK_DATA_BASE = "sqlite+aiosqlite:///file:test_db?mode=memory&cache=shared&uri=true"
 
 engine = create_engine(
     SQL_MOCK_DATA_BASE, 
@@ -43,6 +47,13 @@ engine = create_engine(
     poolclass= StaticPool,
 )
 
+# The sync engine's static connection keeps the database alive, async connections are opened
+# per session because they belong to the event loop that created them
+async_engine = create_async_engine(
+    ASYNC_SQL_MOCK_DATA_BASE,
+    poolclass=NullPool,
+)
+
 # Creating a test session
 TestingSessionLocal = sessionmaker(
     class_=Session, # Ensure it is compatible with SQLModel
@@ -57,7 +68,24 @@ def override_get_db() -> Generator[Session, None, None]:
     yield db
     db.close()
 
+TestingAsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    expire_on_commit=False,
+    bind=async_engine
+)
+
+# Overriding the get_async_db() function in the main app
+async def override_get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+
+# Async tests run on asyncio, the async database engine doesn't support other backends
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
 
 # Starting a session with the in memory database
 @pytest.fixture(scope='module', autouse=True)
@@ -66,12 +94,24 @@ def db() -> Generator[Session, None, None]:
     SQLModel.metadata.create_all(bind=engine)
     db_session = TestingSessionLocal()
     # Creating the initial data for testing
-    init_db(session=db_session)
+    asyncio.run(init_db(session=db_session))
     # Run the init_db()
     yield db_session
     SQLModel.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+async def async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+@pytest.fixture(scope='session')
+def db_engine() -> Engine:
+    # Engine used by the routes
+    return async_engine.sync_engine
+
+
 @pytest.fixture(scope='module')
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
@@ -0,0 +1,177 @@
+import pytest
+import asyncio
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+from jinja2 import Template
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config import settings
+from src.mail import service
+from src.mail.models import EmailOutbox, utcnow
+from src.mail.queue import EmailDeliveryQueue
+from src.mail.schemas import EmailData
+from tests.conftest import TestingAsyncSessionLocal
+
+##=============================================================================================
+## EMAIL TEMPLATES TESTS
+##=============================================================================================
+
+
+def test_precompile_email_templates() -> None:
+    template_names = service.precompile_email_templates()
+    assert sorted(template_names) == ["new_account.html", "reset_password.html"]
+
+
+def test_render_email_template_cached() -> None:
+    context = {"project_name": "project", "username": "user", "password": "pass", "email": "user@example.com"}
+    html_content = service.render_email_template(template_name="new_account.html", context=context)
+
+    # Same output as compiling the file on every call
+    expected = Template((service.TEMPLATES_DIR / "new_account.html").read_text()).render(context)
+    assert html_content == expected
+    # The compiled template is reused
+    assert service.template_env.get_template("new_account.html") is service.template_env.get_template("new_account.html")
+
+
+##=============================================================================================
+## EMAIL OUTBOX TESTS
+##=============================================================================================
+
+
+class FakeResponse:
+    def __init__(self, success: bool) -> None:
+        self.success = success
+        self.status_code = 250 if success else 550
+        self.status_text = "OK" if success else "Mailbox unavailable"
+        self.error = None
+
+
+def fake_send_email(*, success: bool, sent: list | None = None):
+    def send_email(*, email_to: str, subject: str = "", html_content: str = "") -> FakeResponse:
+        if sent is not None:
+            sent.append(email_to)
+        return FakeResponse(success)
+    return send_email
+
+
+async def make_due(session: AsyncSession, email: EmailOutbox) -> None:
+    email.next_attempt_at = utcnow() - timedelta(seconds=1)
+    session.add(email)
+    await session.commit()
+
+
+# Enqueuing tests
+# ---------------------------------------------------------------------------------------------
+
+def test_password_recovery_enqueues_email(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    def fail(**kwargs):
+        raise AssertionError("The route must not send the email")
+    monkeypatch.setattr(service, "send_email", fail)
+
+    r = client.post(f"{settings.API_V1_STR}/login/password-recovery/{settings.FIRST_SUPERUSER}")
+    assert r.status_code == 200
+
+    async def outbox() -> list[EmailOutbox]:
+        async with TestingAsyncSessionLocal() as session:
+            statement = select(EmailOutbox).where(EmailOutbox.email_to == settings.FIRST_SUPERUSER_EMAIL)
+            return list((await session.exec(statement)).all())
+
+    emails = asyncio.run(outbox())
+    assert len(emails) == 1
+    assert emails[0].status == "pending"
+    assert emails[0].attempts == 0
+    assert "Password recovery" in emails[0].subject
+
+
+# Delivery tests
+# ---------------------------------------------------------------------------------------------
+
+@pytest.mark.anyio
+async def test_deliver_email_sent(async_db: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(service, "send_email", fake_send_email(success=True))
+    email = await service.enqueue_email_async(session=async_db, email_to="sent@example.com", subject="s", html_content="secret")
+
+    await service.deliver_due_emails_async(session=async_db, limit=100)
+    await async_db.refresh(email)
+
+    assert email.status == "sent"
+    assert email.attempts == 1
+    assert email.sent_at is not None
+    # The content is not kept after the delivery
+    assert email.html_content == ""
+
+
+@pytest.mark.anyio
+async def test_deliver_email_retry_backoff(async_db: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(service, "send_email", fake_send_email(success=False))
+    email = await service.enqueue_email_async(session=async_db, email_to="retry@example.com")
+
+    before = utcnow()
+    await service.deliver_due_emails_async(session=async_db, limit=100)
+    await async_db.refresh(email)
+
+    assert email.status == "pending"
+    assert email.attempts == 1
+    assert email.last_error.startswith("SMTP 550")
+    first_delay = (email.next_attempt_at - before).total_seconds()
+    assert first_delay >= settings.EMAIL_RETRY_BACKOFF_SECONDS * 0.9
+
+    # Not due yet, nothing is claimed
+    assert email not in await service.claim_due_emails_async(session=async_db, limit=100)
+
+    await make_due(async_db, email)
+    before = utcnow()
+    await service.deliver_due_emails_async(session=async_db, limit=100)
+    await async_db.refresh(email)
+    assert email.attempts == 2
+    assert (email.next_attempt_at - before).total_seconds() >= settings.EMAIL_RETRY_BACKOFF_SECONDS * 2 * 0.9
+
+
+@pytest.mark.anyio
+async def test_deliver_email_failed_after_max_attempts(async_db: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    def raise_error(**kwargs):
+        raise ConnectionRefusedError("SMTP server down")
+    monkeypatch.setattr(service, "send_email", raise_error)
+    email = await service.enqueue_email_async(session=async_db, email_to="failed@example.com")
+
+    for _ in range(settings.EMAIL_MAX_ATTEMPTS):
+        await make_due(async_db, email)
+        await service.deliver_due_emails_async(session=async_db, limit=100)
+        await async_db.refresh(email)
+
+    assert email.status == "failed"
+    assert email.attempts == settings.EMAIL_MAX_ATTEMPTS
+    assert "SMTP server down" in email.last_error
+
+
+def test_retry_delay() -> None:
+    assert settings.EMAIL_RETRY_BACKOFF_SECONDS * 0.9 <= service.retry_delay(attempts=1) <= settings.EMAIL_RETRY_BACKOFF_SECONDS * 1.1
+    assert service.retry_delay(attempts=3) >= settings.EMAIL_RETRY_BACKOFF_SECONDS * 4 * 0.9
+    assert service.retry_delay(attempts=50) <= settings.EMAIL_RETRY_BACKOFF_MAX_SECONDS * 1.1
+
+
+# Delivery queue tests
+# ---------------------------------------------------------------------------------------------
+
+@pytest.mark.anyio
+async def test_delivery_queue_workers(async_db: AsyncSession, monkeypatch: pytest.MonkeyPatch) -> None:
+    sent = []
+    monkeypatch.setattr(service, "send_email", fake_send_email(success=True, sent=sent))
+    queue = EmailDeliveryQueue()
+    queue.start(workers=2, session_factory=TestingAsyncSessionLocal)
+    try:
+        email = await queue.enqueue(session=async_db, email_to="queued@example.com", email_data=EmailData(html_content="", subject="s"))
+        # Woken up by the enqueue, not by the poll interval
+        for _ in range(100):
+            if "queued@example.com" in sent:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await queue.stop()
+
+    assert sent.count("queued@example.com") == 1
+    await async_db.refresh(email)
+    assert email.status == "sent"
+    assert not queue.running
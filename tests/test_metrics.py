@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, REGISTRY
+
+from src.metrics import TimedQueuePool, PoolCollector
+
+##=============================================================================================
+## METRICS TESTS
+##=============================================================================================
+
+
+# Database pool metrics tests
+# ---------------------------------------------------------------------------------------------
+
+def test_pool_collector_gauges() -> None:
+    engine = create_engine("sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=1, pool_logging_name="test_gauges")
+    collector = PoolCollector()
+    collector.register_engine(name="test_gauges", engine=engine)
+    registry = CollectorRegistry()
+    registry.register(collector)
+
+    with engine.connect(), engine.connect():
+        assert registry.get_sample_value("db_pool_checked_out", {"engine":"test_gauges"}) == 2
+        assert registry.get_sample_value("db_pool_overflow", {"engine":"test_gauges"}) == 1
+
+    assert registry.get_sample_value("db_pool_checked_out", {"engine":"test_gauges"}) == 0
+    assert registry.get_sample_value("db_pool_size", {"engine":"test_gauges"}) == 1
+
+
+def test_pool_checkout_wait_and_timeouts() -> None:
+    engine = create_engine("sqlite://", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.01, pool_logging_name="test_wait")
+    labels = {"engine":"test_wait"}
+
+    with engine.connect():
+        # The only connection is in use, the next checkout times out
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    assert REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_count", labels) == 2
+    assert REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_sum", labels) >= 0.01
+    assert REGISTRY.get_sample_value("db_pool_checkout_timeouts_total", labels) == 1
+
+
+def test_metrics_endpoint(client: TestClient) -> None:
+    r = client.get("/metrics/")
+    assert r.status_code == 200
+    assert "db_pool_checked_out" in r.text
@@ -0,0 +1,119 @@
+import io
+import os
+import hashlib
+import pytest
+import pathlib
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from PIL import Image
+
+from src.config import settings
+from src.schemas import ImageCons
+from src.uploads import store_upload, upload_image, is_content_addressed, delete_stored_image, resize_image, pick_variant_size, create_image_variants, UPLOAD_CHUNK_SIZE
+
+##=============================================================================================
+## UPLOADS TESTS
+##=============================================================================================
+
+
+def make_upload(*, data: bytes, filename: str = "img.png", content_type: str = "image/png") -> UploadFile:
+    # Size unknown, as with chunked requests
+    return UploadFile(file=io.BytesIO(data), filename=filename, size=None, headers=Headers({"content-type": content_type}))
+
+
+# Streaming tests
+# ---------------------------------------------------------------------------------------------
+
+@pytest.mark.anyio
+async def test_store_upload(tmp_path: pathlib.Path) -> None:
+    data = os.urandom(UPLOAD_CHUNK_SIZE * 3 + 17)
+    digest = hashlib.sha256(data).hexdigest()
+
+    path = await store_upload(upload=make_upload(data=data), root=str(tmp_path), extension="png", max_bytes=len(data))
+
+    # Named after its content, in a sharded directory
+    assert path == str(tmp_path / digest[:2] / digest[2:4] / f"{digest}.png")
+    assert pathlib.Path(path).read_bytes() == data
+    assert is_content_addressed(path)
+    # No temporary files left behind
+    assert os.listdir(tmp_path) == [digest[:2]]
+
+    # Identical bytes are stored once
+    assert await store_upload(upload=make_upload(data=data), root=str(tmp_path), extension="png", max_bytes=len(data)) == path
+    assert os.listdir(tmp_path) == [digest[:2]]
+    assert os.listdir(tmp_path / digest[:2] / digest[2:4]) == [f"{digest}.png"]
+
+
+@pytest.mark.anyio
+async def test_store_upload_too_large(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(HTTPException) as e:
+        await store_upload(upload=make_upload(data=os.urandom(UPLOAD_CHUNK_SIZE * 2)), root=str(tmp_path), extension="png", max_bytes=UPLOAD_CHUNK_SIZE)
+
+    assert e.value.status_code == 413
+    # The partial upload is removed
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.anyio
+async def test_upload_image_size_enforced_while_streaming(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "UPLOADS_URL", str(tmp_path))
+    image_const = ImageCons(ALLOWED_CONTENT_TYPES=["image/png"], MAX_IMAGE_SIZE=1000, UPLOAD_SUB_DIR="imgs")
+
+    with pytest.raises(HTTPException) as e:
+        await upload_image(image_const=image_const, image=make_upload(data=os.urandom(1001)))
+    assert e.value.status_code == 413
+    assert os.listdir(tmp_path / "imgs") == []
+
+    img_path = await upload_image(image_const=image_const, image=make_upload(data=os.urandom(1000)))
+    assert pathlib.Path(img_path).suffix == ".png"
+    assert pathlib.Path(img_path).stat().st_size == 1000
+
+
+def test_delete_stored_image(tmp_path: pathlib.Path) -> None:
+    stored = tmp_path / f"{'a' * 64}.png"
+    variant = tmp_path / f"{'a' * 64}_64.webp"
+    legacy = tmp_path / "john_doe_photo.png"
+    for path in (stored, variant, legacy):
+        path.write_bytes(b"image")
+
+    delete_stored_image(image_path=str(stored), img_variants={"64": str(variant)})
+    delete_stored_image(image_path=str(legacy))
+
+    # Files with legacy names are not managed by the store
+    assert os.listdir(tmp_path) == ["john_doe_photo.png"]
+
+
+# Image variants tests
+# ---------------------------------------------------------------------------------------------
+
+def test_resize_image(tmp_path: pathlib.Path) -> None:
+    image_path = str(tmp_path / "photo.png")
+    Image.new("RGBA", (800, 400), (255, 0, 0, 128)).save(image_path)
+
+    variants = resize_image(image_path, (64, 256, 1024), "JPEG", 80)
+
+    assert variants == {size: str(tmp_path / f"photo_{size}.jpg") for size in ("64", "256", "1024")}
+    with Image.open(variants["64"]) as image:
+        assert image.size == (64, 32)
+        assert image.format == "JPEG"
+    # Smaller images are never upscaled
+    with Image.open(variants["1024"]) as image:
+        assert image.size == (800, 400)
+
+
+def test_pick_variant_size() -> None:
+    assert pick_variant_size(sizes=(64, 256, 1024), requested=64) == 64
+    assert pick_variant_size(sizes=(64, 256, 1024), requested=100) == 256
+    assert pick_variant_size(sizes=(64, 256, 1024), requested=4000) == 1024
+
+
+@pytest.mark.anyio
+async def test_create_image_variants_not_an_image(tmp_path: pathlib.Path) -> None:
+    image_path = tmp_path / "photo.png"
+    image_path.write_bytes(b"not an image")
+    image_const = ImageCons(ALLOWED_CONTENT_TYPES=["image/png"], MAX_IMAGE_SIZE=1000, UPLOAD_SUB_DIR="imgs", VARIANT_SIZES=(64,))
+
+    with pytest.raises(HTTPException) as e:
+        await create_image_variants(image_const=image_const, image_path=str(image_path))
+    assert e.value.status_code == 415
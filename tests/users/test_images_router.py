@@ -1,7 +1,9 @@
 import pytest
 import pathlib
+import functools
 
 from sqlmodel import Session
+from anyio import to_thread
 from httpx import AsyncClient, ASGITransport
 from fastapi.testclient import TestClient
 from pathlib import Path
@@ -10,6 +12,7 @@ from src.main import app
 from src.config import settings
 from src.users.service import get_user_by_username
 from tests.users.utils import create_random_user
+from tests.utils import create_random_image
 
 ##=============================================================================================
 ## IMAGES ROUTER TESTS
@@ -23,8 +26,8 @@ async def test_fetch_image_file(
         png_accepted_size_image_file: pathlib.Path, 
         db: Session
 ) -> None:
-    # Create a user
-    credentials = create_random_user(db=db)
+    # Create a user (in a thread, the helper runs its own event loop)
+    credentials = await to_thread.run_sync(functools.partial(create_random_user, db=db))
     user_up = get_user_by_username(session=db, user_name=credentials["username"])
     image_file = open(png_accepted_size_image_file, mode="rb")
     # Adding an image to the user
@@ -50,6 +53,95 @@ async def test_fetch_image_file(
     assert og_file_name in file_name # <- making sure the file returned is the one expected
 
 
+@pytest.mark.anyio
+async def test_fetch_image_variant(
+        client: TestClient,
+        normal_user_token_headers: dict[str, str],
+        super_user_token_headers: dict[str, str],
+        png_accepted_size_image_file: pathlib.Path, 
+        db: Session
+) -> None:
+    credentials = await to_thread.run_sync(functools.partial(create_random_user, db=db))
+    user_up = get_user_by_username(session=db, user_name=credentials["username"])
+    image_file = open(png_accepted_size_image_file, mode="rb")
+    r = client.patch(
+        url=f"{settings.API_V1_STR}/users/{user_up.id}",
+        headers=super_user_token_headers,
+        files={"user_image":("test_img.png", image_file, "image/png")}
+    )
+    user_db = r.json()
+    assert sorted(user_db["img_variants"]) == ["1024", "256", "64"]
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.get(
+            url=f"{settings.API_V1_STR}/files/images",
+            headers=normal_user_token_headers,
+            params={"path":user_db["img_path"], "size":200}
+            )
+    # The smallest variant covering the requested size
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert user_db["img_variants"]["256"].split("/")[-1] in response.headers["content-disposition"]
+
+
+@pytest.mark.anyio
+async def test_shared_image_reference_count(
+        client: TestClient,
+        super_user_token_headers: dict[str, str],
+        tmp_path: pathlib.Path,
+        db: Session
+) -> None:
+    # Bytes not uploaded by other tests
+    shared_image = tmp_path / "shared.png"
+    create_random_image(target_size=10000).save(shared_image, "png")
+    user_ids = []
+    for _ in range(2):
+        credentials = await to_thread.run_sync(functools.partial(create_random_user, db=db))
+        user_ids.append(get_user_by_username(session=db, user_name=credentials["username"]).id)
+
+    # Both users upload the same bytes
+    img_paths = []
+    for user_id in user_ids:
+        with open(shared_image, mode="rb") as image_file:
+            r = client.patch(
+                url=f"{settings.API_V1_STR}/users/{user_id}",
+                headers=super_user_token_headers,
+                files={"user_image":("test_img.png", image_file, "image/png")}
+            )
+        img_paths.append(r.json()["img_path"])
+    shared_path = img_paths[0]
+    assert img_paths[1] == shared_path
+
+    r = client.get(
+        url=f"{settings.API_V1_STR}/files/images",
+        headers=super_user_token_headers,
+        params={"path":shared_path}
+    )
+    assert r.headers["cache-control"] == "private, max-age=31536000, immutable"
+
+    # Replacing the image of the first user keeps the file for the second one
+    other_image = tmp_path / "other.png"
+    create_random_image(target_size=10000).save(other_image, "png")
+    with open(other_image, mode="rb") as image_file:
+        r = client.patch(
+            url=f"{settings.API_V1_STR}/users/{user_ids[0]}",
+            headers=super_user_token_headers,
+            files={"user_image":("other.png", image_file, "image/png")}
+        )
+    assert r.json()["img_path"] != shared_path
+    assert Path(shared_path).is_file()
+
+    # Deleting the last user referencing it removes the file and its variants
+    r = client.get(url=f"{settings.API_V1_STR}/users/{user_ids[1]}", headers=super_user_token_headers)
+    variants = r.json()["img_variants"]
+    r = client.delete(url=f"{settings.API_V1_STR}/users/{user_ids[1]}", headers=super_user_token_headers)
+    assert r.status_code == 200
+    assert not Path(shared_path).exists()
+    assert not any(Path(path).exists() for path in variants.values())
+
+
 @pytest.mark.anyio
 async def test_fetch_image_not_user() -> None:
     async with AsyncClient(
@@ -1,11 +1,12 @@
 import random
 from sqlmodel import Session
+from sqlalchemy import Engine
 from fastapi.testclient import TestClient
 
 from src.config import settings
 from src.users.service import get_role_by_name, get_user_by_username
 from tests.users.utils import role_clean_up_test, create_random_role, create_random_user
-from tests.utils import random_lower_string
+from tests.utils import random_lower_string, count_queries
 
 ##=============================================================================================
 ## ROLES ROUTER TESTS
@@ -66,6 +67,50 @@ def test_get_all_roles_names(
     assert type(response["role_names"]) == list
 
 
+def test_get_all_roles_query_count(
+        client: TestClient, super_user_token_headers: dict[str,str], db: Session, db_engine: Engine
+) -> None:
+    for _ in range(3):
+        create_random_role(db=db)
+
+    with count_queries(engine=db_engine) as statements:
+        r = client.get(
+            url=f"{settings.API_V1_STR}/roles/",
+            headers=super_user_token_headers,
+            params={"limit":100}
+        )
+    response = r.json()
+    assert r.status_code == 200
+    assert len(response["data"]) >= 4
+    # Current user, count, roles page and the users of the page
+    assert len(statements) == 4
+
+
+def test_get_all_roles_cursor_pagination(
+        client: TestClient, super_user_token_headers: dict[str,str], db: Session
+) -> None:
+    for _ in range(3):
+        create_random_role(db=db)
+
+    roles = []
+    params = {"cursor":"", "limit":2}
+    while True:
+        r = client.get(
+            url=f"{settings.API_V1_STR}/roles/",
+            headers=super_user_token_headers,
+            params=params
+        )
+        response = r.json()
+        assert r.status_code == 200
+        roles += [role["id"] for role in response["data"]]
+        if response["next_cursor"] is None:
+            break
+        params["cursor"] = response["next_cursor"]
+
+    assert len(roles) == response["count"]
+    assert roles == sorted(set(roles))
+
+
 def test_create_role_super_user(
         client:TestClient, super_user_token_headers:dict[str, str], db: Session
 ) -> None:
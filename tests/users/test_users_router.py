@@ -2,14 +2,15 @@ import random
 import pathlib
 
 from sqlmodel import Session
+from sqlalchemy import Engine
 from fastapi.testclient import TestClient
 
 from src.config import settings
-from tests.utils import random_lower_string, random_date, random_email, random_phone_number
+from tests.utils import random_lower_string, random_date, random_email, random_phone_number, count_queries
 
 from src.auth.service import verify_password
-from src.users.service import get_user_by_username
-from tests.users.utils import user_clean_up_tests, create_random_user
+from src.users.service import get_user_by_username, get_role_by_name
+from tests.users.utils import user_clean_up_tests, create_random_user, create_random_role
 
 ##=============================================================================================
 ## USERS ROUTER TESTS
@@ -30,6 +31,7 @@ def test_get_all_users_super_user(
     assert r.status_code == 200
     assert type(response["data"]) == list
     assert response["count"] == 1
+    assert response["count_estimated"] == False
 
 
 def test_get_all_users_admin_user(
@@ -56,6 +58,72 @@ def test_get_all_users_normal_user(
     assert response["detail"]
 
 
+def test_get_all_users_query_count(
+        client: TestClient, super_user_token_headers: dict[str, str], db: Session, db_engine: Engine
+) -> None:
+    # Users in different roles, each role would be a lazy SELECT without eager loading
+    for _ in range(3):
+        credentials = create_random_user(db=db)
+        user = get_user_by_username(session=db, user_name=credentials["username"])
+        user.role = get_role_by_name(session=db, role_name=create_random_role(db=db))
+        db.add(user)
+    db.commit()
+
+    with count_queries(engine=db_engine) as statements:
+        r = client.get(
+            url=f"{settings.API_V1_STR}/users/",
+            headers=super_user_token_headers,
+            params={"limit":100}
+        )
+    response = r.json()
+    assert r.status_code == 200
+    assert len(response["data"]) >= 4
+    # Current user, count, users page and the roles of the page
+    assert len(statements) == 4
+
+
+def test_get_all_users_cursor_pagination(
+        client: TestClient, super_user_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        create_random_user(db=db)
+
+    for order_by in ["id", "last_name"]:
+        users = []
+        params = {"cursor":"", "limit":2, "order_by":order_by}
+        while True:
+            r = client.get(
+                url=f"{settings.API_V1_STR}/users/",
+                headers=super_user_token_headers,
+                params=params
+            )
+            response = r.json()
+            assert r.status_code == 200
+            users += response["data"]
+            if response["next_cursor"] is None:
+                break
+            params["cursor"] = response["next_cursor"]
+
+        # Every user is returned once and in order
+        assert len(users) == response["count"]
+        assert len({user["id"] for user in users}) == len(users)
+        keys = [(user[order_by], user["id"]) for user in users]
+        assert keys == sorted(keys)
+
+
+def test_get_all_users_invalid_cursor(
+        client: TestClient, super_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        url=f"{settings.API_V1_STR}/users/",
+        headers=super_user_token_headers,
+        params={"cursor":"not a cursor"}
+    )
+    response = r.json()
+    assert r.status_code == 400
+    assert response["detail"] == "Invalid pagination cursor."
+
+
 def test_super_user_post_new_user(
         client:TestClient,
         super_user_token_headers: dict[str, str],
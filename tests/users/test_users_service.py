@@ -1,11 +1,17 @@
 import pytest
 import random
+import asyncio
+import functools
+from anyio import to_thread
 
 from sqlmodel import Session
 from datetime import date
 
 from src.config import settings
-from src.users.service import create_user, get_role_by_name, get_user_by_username, get_user_by_id, update_user, update_hash_password, delete_user, terminate_user, authenticate
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.users.service import update_user_async, get_user_by_username_async, get_role_by_name_async
+from src.users.service import create_user, get_role_by_name, get_user_by_username, get_user_by_id, update_user, update_hash_password, delete_user, terminate_user, authenticate, encode_cursor, decode_cursor, count_records, invalidate_count
+from src.users.models import Users, Roles
 from src.users.schemas import CreateUser, UpdateUser
 from src.auth.service import verify_password
 from tests.users.utils import random_lower_string, random_email, random_date, random_phone_number, create_random_user, create_random_role
@@ -35,9 +41,9 @@ def test_create_user_with_img_path(db:Session) -> None:
             salary=random.random() * random.randint(100,1000),
     )
     role = get_role_by_name(session=db, role_name=settings.FIRST_ROLE)
-    user = create_user(
+    user = asyncio.run(create_user(
         session=db, user_create=user_in, role=role, img_path=img_path
-    )
+    ))
     assert user.img_path == img_path
     assert user.user_name == user_name
     assert verify_password(password, user.hashed_password)
@@ -60,9 +66,9 @@ def test_create_user_without_img_path(db:Session) -> None:
             salary=random.random() * random.randint(100,1000),
     )
     role = get_role_by_name(session=db, role_name=settings.FIRST_ROLE)
-    user = create_user(
+    user = asyncio.run(create_user(
         session=db, user_create=user_in, role=role
-    )
+    ))
     assert user.user_name == user_name
     assert verify_password(password, user.hashed_password)
 
@@ -70,14 +76,14 @@ def test_create_user_without_img_path(db:Session) -> None:
 # Test: Invalid session
 def test_create_user_invalid_session() -> None:
     with pytest.raises(AttributeError):
-        create_user(session=None, user_create="mock_user_create", role=settings.TEST_ROLE)
+        asyncio.run(create_user(session=None, user_create="mock_user_create", role=settings.TEST_ROLE))
 
 
 # Test: Invalid user_create data
 def test_create_user_invalid_user_create(db: Session):
     role = get_role_by_name(session=db, role_name=settings.TEST_ROLE)
     with pytest.raises(AttributeError):
-        create_user(session=db, user_create=None, role=role)
+        asyncio.run(create_user(session=db, user_create=None, role=role))
 
 
 # Test: Invalid role
@@ -97,7 +103,7 @@ def test_create_user_invalid_role(db:Session):
             salary=random.random() * random.randint(100,1000),
     )
     with pytest.raises(AttributeError):
-        create_user(session=db, user_create=user_in, role=None)
+        asyncio.run(create_user(session=db, user_create=user_in, role=None))
 
 # Get user by name tests
 # ---------------------------------------------------------------------------------------------
@@ -150,7 +156,7 @@ def test_update_user(db:Session) -> None:
 
     # Create an UpdateUser instance with new data
     update_data = UpdateUser(user_name="updated_user", password="newpassword")
-    updated_user = update_user(session=db, db_user=user, user_in=update_data)
+    updated_user = asyncio.run(update_user(session=db, db_user=user, user_in=update_data))
 
     assert updated_user.user_name == "updated_user"
     assert verify_password(plain_password="newpassword", hashed_password=updated_user.hashed_password)
@@ -164,7 +170,7 @@ def test_update_user_with_role(db:Session) -> None:
     role = get_role_by_name(session=db, role_name=role_name)
 
     update_data = UpdateUser(user_name="updated_user_with_role")
-    updated_user = update_user(session=db, db_user=user, user_in=update_data, role=role)
+    updated_user = asyncio.run(update_user(session=db, db_user=user, user_in=update_data, role=role))
 
     assert updated_user.user_name == "updated_user_with_role"
     assert role.id == updated_user.roles_id
@@ -176,12 +182,29 @@ def test_update_user_with_image_path(db:Session)-> None:
 
     update_data = UpdateUser(user_name="updated_user_with_img")
     img_path = "/path/to/image.jpg"
-    updated_user = update_user(session=db, db_user=user, user_in=update_data, img_path=img_path)
+    updated_user = asyncio.run(update_user(session=db, db_user=user, user_in=update_data, img_path=img_path))
 
     assert updated_user.user_name == "updated_user_with_img"
     assert updated_user.img_path == img_path
 
 
+# Test updating a user's role with an async session
+@pytest.mark.anyio
+async def test_update_user_async_with_role(db:Session, async_db: AsyncSession) -> None:
+    # In a thread, the helper runs its own event loop
+    credentials = await to_thread.run_sync(functools.partial(create_random_user, db=db))
+    role_name = create_random_role(db=db)
+    user = await get_user_by_username_async(session=async_db, user_name=credentials["username"])
+    role = await get_role_by_name_async(session=async_db, role_name=role_name)
+
+    update_data = UpdateUser(first_name="updated_async")
+    updated_user = await update_user_async(session=async_db, db_user=user, user_in=update_data, role=role)
+
+    # The role is loaded, async sessions can't lazy load it
+    assert updated_user.first_name == "updated_async"
+    assert updated_user.role.name == role_name
+
+
 # Test updating a user, invalid user
 def test_update_invalid_user(db:Session) -> None:
     update_data = {
@@ -189,7 +212,7 @@ def test_update_invalid_user(db:Session) -> None:
         "password":"newpassword"
     }
     with pytest.raises(AttributeError):
-        update_user(session=db, db_user={"user_name":"Invalid user"}, user_in=update_data)
+        asyncio.run(update_user(session=db, db_user={"user_name":"Invalid user"}, user_in=update_data))
 
 
 # Test updating a user, invalid role
@@ -201,7 +224,7 @@ def test_update_invalid_role(db:Session) -> None:
         "password":"newpassword"
     }
     with pytest.raises(AttributeError):
-        update_user(session=db, db_user=user, user_in=update_data, role="invalid role")
+        asyncio.run(update_user(session=db, db_user=user, user_in=update_data, role="invalid role"))
 
 
 # Test updating a user, invalid update data
@@ -212,7 +235,7 @@ def test_update_invalid_update_data(db:Session) -> None:
        "Not Valid data":22
     }
     with pytest.raises(AttributeError):
-        update_user(session=db, db_user=user, user_in=update_data)
+        asyncio.run(update_user(session=db, db_user=user, user_in=update_data))
 
 # Update hashed password tests
 # ---------------------------------------------------------------------------------------------
@@ -223,7 +246,7 @@ def test_update_hashed_password(db:Session) -> None:
     user = get_user_by_username(session=db, user_name=credentials["username"])
     
     # Updating the password
-    message = update_hash_password(session=db, db_user=user, password="newpassword")
+    message = asyncio.run(update_hash_password(session=db, db_user=user, password="newpassword"))
 
     # Getting the updated password
     user = get_user_by_username(session=db, user_name=credentials["username"])
@@ -236,7 +259,7 @@ def test_update_hashed_password_invalid_user(db:Session) -> None:
 
     # Updating an invalid user
     with pytest.raises(AttributeError):
-        update_hash_password(session=db, db_user={"user_name":"Invalid user"}, password="newpass")
+        asyncio.run(update_hash_password(session=db, db_user={"user_name":"Invalid user"}, password="newpass"))
 
 
 # Terminate user tests
@@ -272,15 +295,66 @@ def test_delete_user(db:Session) -> None:
 def test_authenticate_user(db:Session) -> None:
     credentials = create_random_user(db=db)
 
-    assert authenticate(session=db, user_name=credentials["username"], password=credentials["password"])
+    assert asyncio.run(authenticate(session=db, user_name=credentials["username"], password=credentials["password"]))
 
 
 def test_authenticate_user_incorrect_password(db:Session) -> None:
     credentials = create_random_user(db=db)
 
-    assert authenticate(session=db, user_name=credentials["username"], password="incorrect password") == None
+    assert asyncio.run(authenticate(session=db, user_name=credentials["username"], password="incorrect password")) == None
 
 
 def test_authenticate_invalid_user(db:Session) -> None:
 
-    assert authenticate(session=db, user_name="Not a user", password="Not a password") == None
+    assert asyncio.run(authenticate(session=db, user_name="Not a user", password="Not a password")) == None
+
+
+
+# Pagination cursor tests
+# ---------------------------------------------------------------------------------------------
+
+def test_decode_cursor() -> None:
+    cursor = encode_cursor(order_by="register_date", value=date(2024, 1, 31), last_id=7)
+
+    assert decode_cursor(cursor=cursor, model=Users, order_by="register_date") == (date(2024, 1, 31), 7)
+
+
+def test_decode_cursor_other_order() -> None:
+    cursor = encode_cursor(order_by="register_date", value=date(2024, 1, 31), last_id=7)
+
+    assert decode_cursor(cursor=cursor, model=Users, order_by="last_name") is None
+
+
+def test_decode_cursor_invalid() -> None:
+    assert decode_cursor(cursor="not a cursor", model=Users, order_by="id") is None
+
+
+
+# Count strategies tests
+# ---------------------------------------------------------------------------------------------
+
+def test_count_records_exact(db:Session) -> None:
+    count, estimated = count_records(session=db, model=Users)
+    create_random_user(db=db)
+
+    assert count_records(session=db, model=Users) == (count + 1, False)
+    assert not estimated
+
+
+def test_count_records_cached(db:Session) -> None:
+    invalidate_count(model=Roles)
+    count, _ = count_records(session=db, model=Roles, strategy="cached")
+    # Records added outside the service don't invalidate the cached count
+    db.add(Roles(name=random_lower_string()))
+    db.commit()
+    assert count_records(session=db, model=Roles, strategy="cached") == (count, False)
+    # Creating a role through the service does
+    create_random_role(db=db)
+    assert count_records(session=db, model=Roles, strategy="cached") == (count + 2, False)
+
+
+def test_count_records_estimate_fallback(db:Session) -> None:
+    # The planner estimate is only available on Postgres, other databases count exactly
+    count, _ = count_records(session=db, model=Users)
+
+    assert count_records(session=db, model=Users, strategy="estimate") == (count, False)
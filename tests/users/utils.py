@@ -1,4 +1,5 @@
 import random
+import asyncio
 
 from sqlmodel import Session
 from pathlib import Path
@@ -43,7 +44,7 @@ def create_random_user(*, db: Session) -> dict[str, str]:
         salary=random.random() * random.randint(100,1000)
         )
     role = get_role_by_name(session=db, role_name=settings.FIRST_ROLE) 
-    create_user(session=db, user_create=user_in, role=role)
+    asyncio.run(create_user(session=db, user_create=user_in, role=role))
     return {"username": username, "password": password}
 
 
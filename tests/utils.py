@@ -1,11 +1,14 @@
 import random
 import string
+from contextlib import contextmanager
+from collections.abc import Generator
 import phonenumbers
 import numpy as np
 
 from PIL import Image
 from datetime import date
 from sqlmodel import Session
+from sqlalchemy import Engine, event
 from fastapi.testclient import TestClient
 from pydantic_extra_types.phone_numbers import PhoneNumber
 
@@ -225,6 +228,28 @@ def terminated_user_authentication_headers_and_password(
 
 
 
+@contextmanager
+def count_queries(*, engine: Engine) -> Generator[list[str], None, None]:
+    '''
+    Records every SQL statement executed on the engine inside the `with` block,
+    use it to assert the number of queries an endpoint runs.
+
+    Returns
+    ---
+    A list with the executed statements.
+    '''
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 def create_random_image(*, target_size: int) -> Image:
     """
     Creates a random image of the specified type and size and wraps it in an UploadFile instance.